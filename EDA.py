@@ -1,8 +1,47 @@
+import time
+
+import numpy as np
 import pandas as pd 
 
+from instrumentation import enable_from_environment, instrument
+from storage import load_frame, save_snapshot, stage_path
+
 
-df = pd.read_csv('loan_payments.csv') 
+#target data types for the loan payments table, column -> conversion
+#dtype: 'category', 'datetime' (with format), 'month' (with format and output), 'bool' (with true_values),
+#'int64' or any pandas dtype
+#round: decimal places, parser: function applied to the raw Series before the dtype
+loan_payments_schema = {
+    #Finite list of text values
+    'grade': {'dtype': 'category'},
+    'sub_grade': {'dtype': 'category'},
+    'home_ownership': {'dtype': 'category'},
+    'verification_status': {'dtype': 'category'},
+    'loan_status': {'dtype': 'category'},
+    'purpose': {'dtype': 'category'},
+    'application_type': {'dtype': 'category'},
+    'employment_length': {'dtype': 'category'},
+    #Date and time values e.g Dec 2018
+    'issue_date': {'dtype': 'month', 'format': '%b-%Y'},
+    'earliest_credit_line': {'dtype': 'month', 'format': '%b-%Y'},
+    'last_payment_date': {'dtype': 'month', 'format': '%b-%Y'},
+    'next_payment_date': {'dtype': 'month', 'format': '%b-%Y'},
+    'last_credit_pull_date': {'dtype': 'month', 'format': '%b-%Y'},
+    #entries should be to 2 decimal places as represent monetary values 
+    'funded_amount_inv': {'round': 2},
+    'collection_recovery_fee': {'round': 2},
+    #Integer numbers, left as floats while they contain nulls
+    'funded_amount': {'dtype': 'int64'},
+    'mths_since_last_delinq': {'dtype': 'int64'},
+    'mths_since_last_record': {'dtype': 'int64'},
+    'collections_12_mths_ex_med': {'dtype': 'int64'},
+    'mths_since_last_major_derog': {'dtype': 'int64'},
+    #Boolean values as column has 2 unique values n or y
+    'payment_plan': {'dtype': 'bool', 'true_values': ['y']},
+}
 
+
+@instrument
 class DataTransform: 
     """
     The DataTransform class provides methods to transform different types of data in a pandas DataFrame,
@@ -28,6 +67,8 @@ class DataTransform:
     flaot_to_int(): Changes float column to int data type
     object_to_bool: Changes column to boolean data type
     term_to_int(): Changes term to int data type and removes 'months'
+    apply_schema(): Applies every conversion in a schema in one pass over the columns
+    optimise_memory(): Downcasts numbers and converts repeated text to category to reduce memory
 
     """
     def  __init__(self, df):
@@ -61,7 +102,7 @@ class DataTransform:
         """
         #Date and time values e.g Dec 2018
         for col in dates:
-            self.df[col] = pd.to_datetime(self.df[col], format="%b-%Y") 
+            self.df[col] = parse_months(self.df[col], format="%b-%Y") 
     
     def round_floats(self,excess_dp):
         """
@@ -100,28 +141,258 @@ class DataTransform:
         #Boolean values (True/False) as column has 2 unique values n or y
         self.df[col] = self.df[col].astype("bool")
     
-    @staticmethod
-    def term_to_int():
-        df['term'] = df['term'].str.replace('months', '')
-        df['term'] = df['term'].astype(int)
+    def term_to_int(self):
+        """
+        The function removes the "months" string from the term column and converts it to integer data type.
+        """
+        self.df['term'] = self.df['term'].str.replace('months', '')
+        self.df['term'] = self.df['term'].astype(int)
+
+    def apply_schema(self, schema):
+        """
+        The function applies all the conversions of a schema in one pass. Each column is read once, all of
+        its conversions are chained, and the result is written back once, instead of one copy per step.
         
+        :param schema: A dictionary of column name -> conversion, see `loan_payments_schema`
+        :return: A DataFrame with the time taken and the memory before and after for each column
+        """
+        report = []
+        for col, spec in schema.items():
+            if col not in self.df.columns:
+                continue
+            start = time.perf_counter()
+            memory_before = self.df[col].memory_usage(index=False, deep=True)
+            self.df[col] = convert_column(self.df[col], spec)
+            report.append({
+                'column': col,
+                'dtype': str(self.df[col].dtype),
+                'seconds': time.perf_counter() - start,
+                'memory_before': memory_before,
+                'memory_after': self.df[col].memory_usage(index=False, deep=True),
+            })
+        return pd.DataFrame(report, columns=['column', 'dtype', 'seconds', 'memory_before', 'memory_after'])
 
+    def optimise_memory(self, max_category_ratio=0.5, float_tolerance=0.0, exclude=()):
+        """
+        The function profiles every column and stores it in the smallest data type that keeps its values:
+        integers are downcast to the smallest width, floats holding only whole numbers become nullable
+        integers (the case `float_to_int` skips when there are nulls), floats become float32 when that
+        changes no value by more than `float_tolerance`, and text with few distinct values becomes category.
+        
+        :param max_category_ratio: Text columns with at most this share of distinct values become category
+        :param float_tolerance: The largest change allowed when storing a float as float32, e.g. 0.005 for
+        monetary values rounded to 2 decimal places. 0 only allows exact conversions
+        :param exclude: Column names to leave as they are
+        :return: A DataFrame with the data type and memory of each column before and after
+        """
+        report = []
+        for col in self.df.columns:
+            if col in exclude:
+                continue
+            before = self.df[col]
+            after = optimise_column(before, max_category_ratio, float_tolerance)
+            if after is not before:
+                self.df[col] = after
+            report.append({
+                'column': col,
+                'dtype_before': str(before.dtype),
+                'dtype_after': str(after.dtype),
+                'memory_before': before.memory_usage(index=False, deep=True),
+                'memory_after': after.memory_usage(index=False, deep=True),
+            })
+        return pd.DataFrame(report, columns=['column', 'dtype_before', 'dtype_after', 'memory_before', 'memory_after'])
 
-if __name__ == '__main__': 
+
+def convert_column(series, spec):
+    """
+    The function applies one schema entry to a Series: the parser, then the rounding, then the dtype.
+    
+    :param series: The pandas Series to convert
+    :param spec: The schema entry for the column
+    :return: The converted Series
+    """
+    if 'parser' in spec:
+        series = spec['parser'](series)
+    if 'round' in spec:
+        series = series.round(spec['round'])
+    dtype = spec.get('dtype')
+    if dtype is None or series.dtype == dtype:
+        return series
+    if dtype == 'datetime':
+        return pd.to_datetime(series, format=spec.get('format'))
+    if dtype == 'month':
+        return parse_months(series, format=spec.get('format', '%b-%Y'), output=spec.get('output', 'datetime'))
+    if dtype == 'bool':
+        return series.isin(spec.get('true_values', [True]))
+    if dtype == 'int64' and series.isna().any():
+        #nulls can't be stored in int64, same as astype(errors="ignore")
+        return series
+    return series.astype(dtype)
+
+
+#month strings already parsed, shared by every date column: (format, string) -> months since Jan 1970
+_month_lookup = {}
+
+
+def parse_months(series, format='%b-%Y', output='datetime'):
+    """
+    The function parses a column of month strings such as "Dec-2018". A loan table has millions of rows
+    but only a few hundred distinct months, so each distinct string is parsed once, kept in a lookup shared
+    by all the date columns, and mapped back to the rows with integer codes.
+    
+    :param series: The pandas Series of month strings, object or category dtype
+    :param format: The strftime format of the strings, it must not contain a day or time
+    :param output: 'datetime' for datetime64 (first day of the month), 'period' for Period[M] or
+    'ordinal' for a nullable Int16 count of months since January 1970
+    :return: The parsed Series with the same index
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+
+    missing = [value for value in uniques if (format, value) not in _month_lookup]
+    if missing:
+        parsed = pd.to_datetime(pd.Index(missing, dtype=object), format=format)
+        ordinals = (parsed.year - 1970) * 12 + parsed.month - 1
+        _month_lookup.update(zip(((format, value) for value in missing), ordinals.tolist()))
+
+    lookup = np.array([_month_lookup[(format, value)] for value in uniques], dtype='int64')
+    is_null = codes < 0
+    months = lookup[np.where(is_null, 0, codes)] if len(lookup) else np.zeros(len(codes), dtype='int64')
+    return pd.Series(_month_values(months, is_null, output), index=series.index, name=series.name)
+
+
+def months_from_ordinals(series, output='datetime'):
+    """
+    The function converts a column of month counts since January 1970 (as made by `parse_months` with
+    output='ordinal', or computed by the database in `pushdown.month_ordinal`) to the `parse_months` output.
+    
+    :param series: A pandas Series of whole numbers, nulls allowed
+    :return: The converted Series with the same index
+    """
+    values = series.to_numpy(dtype='float64', na_value=np.nan)
+    is_null = np.isnan(values)
+    months = np.where(is_null, 0, values).astype('int64')
+    return pd.Series(_month_values(months, is_null, output), index=series.index, name=series.name)
+
+
+def _month_values(months, is_null, output):
+    """
+    The function builds the array of months for `output` from month counts since January 1970 and a null mask.
+    """
+    if output == 'ordinal':
+        return pd.arrays.IntegerArray(months.astype('int16'), is_null)
+    if output == 'period':
+        return pd.arrays.PeriodArray(np.where(is_null, np.iinfo('int64').min, months), dtype=pd.PeriodDtype('M'))
+    if output == 'datetime':
+        values = months.astype('datetime64[M]').astype('datetime64[ns]')
+        values[is_null] = np.datetime64('NaT')
+        return values
+    raise ValueError(f"Unknown output {output}, expected 'datetime', 'period' or 'ordinal'")
 
 
-    categories = ['grade','sub_grade', 'home_ownership', 'verification_status', 'loan_status', 'purpose', 'application_type', 'employment_length']
-    dates = ['issue_date', 'earliest_credit_line', 'last_payment_date', 'next_payment_date', 'last_credit_pull_date']
-    excess_dp = ['funded_amount_inv', 'collection_recovery_fee']
-    floats = ['funded_amount', 'mths_since_last_delinq', 'mths_since_last_record', 'collections_12_mths_ex_med', 'mths_since_last_major_derog']
+def smallest_integer_dtype(low, high, nullable=False):
+    """
+    The function returns the smallest integer data type that holds every value from `low` to `high`.
+    
+    :param nullable: If True the pandas nullable type ('Int8' ...) is returned instead of the numpy one
+    """
+    for dtype in ('int8', 'int16', 'int32', 'int64'):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return dtype.capitalize() if nullable else dtype
+    return 'Int64' if nullable else 'int64'
+
+
+def optimise_column(series, max_category_ratio=0.5, float_tolerance=0.0):
+    """
+    The function returns `series` in the smallest data type that keeps its values, see
+    `DataTransform.optimise_memory`. The same Series is returned when nothing can be saved.
+    """
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype):
+        return series
+    if pd.api.types.is_integer_dtype(dtype):
+        if series.isna().all():
+            return series
+        nullable = isinstance(dtype, pd.api.extensions.ExtensionDtype)
+        target = smallest_integer_dtype(series.min(), series.max(), nullable)
+        return series if target == str(dtype) else series.astype(target)
+    if pd.api.types.is_float_dtype(dtype):
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+        present = values[~np.isnan(values)]
+        if len(present) == 0:
+            return series
+        if np.all(np.isfinite(present)) and np.all(present == np.round(present)):
+            #whole numbers: float only because of nulls, so use a nullable integer
+            return series.astype(smallest_integer_dtype(present.min(), present.max(), nullable=True))
+        if dtype != 'float32' and np.max(np.abs(present.astype('float32') - present)) <= float_tolerance:
+            return series.astype('float32')
+        return series
+    if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+        if len(series) and series.nunique(dropna=True) <= max_category_ratio * len(series):
+            return series.astype('category')
+    return series
 
+
+def read_csv_with_schema(path, schema, **kwargs):
+    """
+    The function reads a CSV file and converts the columns while parsing, through the dtype, parse_dates,
+    converters and true/false value hooks of `pd.read_csv`. Conversions the parser can't do, such as
+    rounding, are applied afterwards with `DataTransform.apply_schema`.
+    
+    :param path: The CSV file to read
+    :param schema: A dictionary of column name -> conversion, see `loan_payments_schema`
+    :param kwargs: Any other arguments for `pd.read_csv`
+    :return: The converted DataFrame
+    """
+    dtype, parse_dates, date_formats, converters, remaining = {}, [], {}, {}, {}
+    for col, spec in schema.items():
+        if 'parser' in spec and set(spec) == {'parser'}:
+            converters[col] = spec['parser']
+        elif spec.get('dtype') == 'category' and 'round' not in spec:
+            dtype[col] = 'category'
+        elif spec.get('dtype') == 'month':
+            #read as category so parse_months gets the distinct strings without factorizing again
+            dtype[col] = 'category'
+            remaining[col] = spec
+        elif spec.get('dtype') == 'datetime':
+            parse_dates.append(col)
+            date_formats[col] = spec.get('format')
+        else:
+            remaining[col] = spec
+    df = pd.read_csv(path, dtype=dtype, parse_dates=parse_dates, date_format=date_formats or None,
+                     converters=converters, **kwargs)
+    DataTransform(df).apply_schema(remaining)
+    return df
+
+
+def transform_loan_payments(df, report=False):
+    """
+    The function applies the target data types of the loan payments table to a dataframe. It is used
+    on the full table and on each chunk streamed from the database.
+    
+    :param df: The pandas DataFrame (or chunk of the table) to transform
+    :param report: If True the per column report from `DataTransform.apply_schema` is returned as well
+    :return: The transformed DataFrame
+    """
     transform = DataTransform(df)
-    transform.object_to_category(categories)
-    transform.object_to_date(dates)
-    transform.round_floats(excess_dp)
-    transform.float_to_int(floats)
-    transform.object_to_bool('payment_plan')
+    conversion_report = transform.apply_schema(loan_payments_schema)
+    if report:
+        return transform.df, conversion_report
+    return transform.df
+        
+
+
+if __name__ == '__main__': 
+    enable_from_environment()
+    df = load_frame(stage_path('loan_payments'))
+    df, conversion_report = transform_loan_payments(df, report=True)
     
-print(df.info())
+    print(conversion_report.to_string(index=False))
+    memory_report = DataTransform(df).optimise_memory()
+    print(memory_report.to_string(index=False))
+    print(df.info())
 
-df.to_csv('transformed_loan_payments.csv')
\ No newline at end of file
+    #analysis processes memory-map this snapshot instead of each parsing their own copy
+    save_snapshot(df, stage_path('transformed_loan_payments', 'arrow'))
\ No newline at end of file
@@ -1,14 +1,48 @@
-from sklearn.impute import SimpleImputer
-import pandas as pd 
-import numpy as np
-import seaborn as sns
-import missingno as msno
-import matplotlib.patches as mpatches
-import matplotlib.pyplot as plt
+from correlation import cached_correlation, correlation_frame
+from imputation import NullImputer
+from instrumentation import enable_from_environment, instrument
+from outliers import OutlierFilter
+from plot_aggregates import binned_kde, box_stats, histogram_1d, histogram_2d, missingness_blocks, stratified_sample
+from profiling import parallel_profile_chunks, parallel_profile_file, profile_chunks
+from skew_transform import SkewTransformer
+from storage import load_snapshot, save_snapshot, stage_path
 
-df = pd.read_csv('transformed_loan_payments.csv') 
+#matplotlib and seaborn are imported inside the plotter methods, so importing this module
+#(e.g. in a worker process) does not pay for them or load any data
 
-class DataFrameInfo:
+
+class LazyFrame:
+    """
+    The LazyFrame class holds the dataframe used by `DataFrameInfo`, `plotter` and `DataFrameTransform`.
+    The dataframe is either given, or loaded from the transformed snapshot the first time it is used.
+
+    Paramaters:
+    df: The pandas DataFrame, or None to load it from `path` when needed
+    path: The snapshot to load, by default the output of EDA.py
+
+    Atributes:
+    self.df: The pandas dataframe
+    """
+    def __init__(self, df=None, path=None):
+        """
+        The function initialises the class with a dataframe, or the snapshot to load it from.
+        """
+        self._df = df
+        self.path = path or stage_path('transformed_loan_payments', 'arrow')
+
+    @property
+    def df(self):
+        if self._df is None:
+            self._df = load_snapshot(self.path)
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+
+
+@instrument
+class DataFrameInfo(LazyFrame):
     """
     The DataFrameInfo class provides methods to retrieve information about a DataFrame, such as data
     types, summary statistics, distinct values for categorical columns, shape of the DataFrame, and
@@ -33,28 +67,29 @@ class DataFrameInfo:
 
     null_count(): Finds the amount of null values in the dataframe
 
+    profile(): Finds the statistics of every column in one pass over the dataframe in chunks
+
 
     """ 
-    def __init__(self, df):
+    def __init__(self, df=None, path=None):
         """
         The function initializes an object with a dataframe as an attribute.
         
         :param df: The parameter "df" is a variable that represents a pandas DataFrame object. It is
-        used to store and manipulate tabular data in a structured format
+        used to store and manipulate tabular data in a structured format. If None the dataframe is
+        loaded from the snapshot at `path` when it is first used
         """
-        self.df = df
+        super().__init__(df, path)
 
-    @staticmethod
-    def df_shape():
+    def df_shape(self):
         """
         The function "df_shape" prints the shape of a DataFrame and returns the shape as a tuple.
         :return: The shape of the DataFrame.
         """
         print('The shape of the DataFrame: ')
-        return df.shape 
+        return self.df.shape 
 
-    @staticmethod   
-    def df_information():
+    def df_information(self):
         """
         The function "df_information" prints information about the data types of a DataFrame.
         :return: The `df.info()` method returns information about the DataFrame, including the number of
@@ -62,44 +97,59 @@ class DataFrameInfo:
         """
         #check data types changed from DataTransform 
         print("Information about data types")
-        return df.info()
+        return self.df.info()
     
-    @staticmethod
-    def Extract_stats():
+    def Extract_stats(self):
         """
         The function "Extract_stats" prints the description of a dataframe, including the median,
         standard deviation, and mean.
         """
        
         print('Description of the dataframe:')
-        describe = df.describe()
+        describe = self.df.describe()
         print(f'The median is: {describe.loc["50%"]}')
         print(f'The standard deviation is: {describe.loc["std"]}')
         print(f'The mean is: {describe.loc["mean"]}')
     
-    @staticmethod
-    def distinct_values_categories():
+    def distinct_values_categories(self):
         """
         The function `distinct_values_cat` returns the number of distinct values for each categorical
         column in a DataFrame.
         :return: the number of distinct values for each category column in the DataFrame.
         """
-        categories = df.select_dtypes(include="category").columns
-        distinct_values = {col: df[col].unique() for col in categories}
+        categories = self.df.select_dtypes(include="category").columns
+        distinct_values = {col: self.df[col].unique() for col in categories}
         return distinct_values
     
     
-    @staticmethod
-    def null_count():
+    def null_count(self):
         """
         The function calculates the total number and percentage of null values in a DataFrame.
         """
-        total_nulls = df.isnull().sum()
-        percentage_of_nulls = total_nulls * 100 / len(df)
+        total_nulls = self.df.isnull().sum()
+        percentage_of_nulls = total_nulls * 100 / len(self.df)
         print(f'Total of null values is {total_nulls}')
         print(f'Percentage of nulls is {percentage_of_nulls}') 
 
-class plotter: 
+    def profile(self, chunksize=100000, workers=1):
+        """
+        The function finds the count, nulls, mean, standard deviation, min/max, quartiles and number of
+        distinct values of every column in a single pass over the dataframe, one chunk of rows at a time.
+        Use `profiling.profile_file` for a table that does not fit in memory.
+        
+        :param chunksize: The number of rows profiled at a time
+        :param workers: The number of processes profiling chunks at the same time. If the dataframe has
+        not been loaded yet, each process reads its own part of the snapshot instead of being sent chunks
+        :return: A DataFrame with one row of statistics per column
+        """
+        if workers > 1 and self._df is None:
+            return parallel_profile_file(self.path, workers).summary()
+        chunks = (self.df.iloc[start:start + chunksize] for start in range(0, len(self.df), chunksize))
+        if workers > 1:
+            return parallel_profile_chunks(chunks, workers).summary()
+        return profile_chunks(chunks).summary()
+
+class plotter(LazyFrame): 
     """
     The `plotter` class provides methods for creating various plots for the loan
     payments data.
@@ -115,6 +165,8 @@ class plotter:
 
     Atributes: 
     self.df: This is the pandas dataframe
+    self.output: None to show the figures, or the file path (without a suffix) the next figure is saved to
+    self.formats: The file formats the figures are saved in, e.g. ['png', 'svg']
 
     Methods:
     __init__(): Initialises the class
@@ -123,6 +175,8 @@ class plotter:
 
     scatter_plot(): Plots a scatter plot
      
+    density_plot(): Plots the density of two columns on a grid, for tables too large for a scatter plot
+
     histogram(): Plots a histogram 
     
     box_plot(): Plots a boxplot 
@@ -132,86 +186,171 @@ class plotter:
     heat_map(): Plots a heatmap to highlight the correlated values 
     
     """
-    def __init__(self, df):
+    def __init__(self, df=None, path=None):
         """
-        The function initializes an object with a dataframe attribute.
+        The function initializes an object with a dataframe attribute, loaded from the snapshot at
+        `path` when first used if `df` is None.
         """
-        self.df = df
+        super().__init__(df, path)
+        self.output = None
+        self.formats = ['png']
+
+    def _show(self):
+        """
+        The function shows the current figure, or when `self.output` is set saves it in each of
+        `self.formats` and closes it, for batch reports without a display (see `report.py`).
+        """
+        import matplotlib.pyplot as plt
+        if self.output is None:
+            plt.show()
+            return
+        figure = plt.gcf()
+        for file_format in self.formats:
+            figure.savefig(f"{self.output}.{file_format}", format=file_format, bbox_inches='tight')
+        plt.close(figure)
     
-    @staticmethod
-    def msno_matrix():
+    def msno_matrix(self, n_blocks=200):
         """
-        The function `msno_matrix` creates a matrix plot to visualize missing values in a dataframe.
+        The function `msno_matrix` creates a matrix plot to visualize missing values in a dataframe. The
+        rows are grouped into `n_blocks` blocks and each cell is shaded by the share of values present in
+        the block, so the plot does not depend on the number of rows.
         """
+        import matplotlib.patches as mpatches
+        import matplotlib.pyplot as plt
+        present = 1 - missingness_blocks(self.df, n_blocks)
         plt.figure(figsize=(10,5))
-        msno.matrix(df)
+        plt.imshow(present, aspect='auto', cmap='Greys', vmin=0, vmax=1.5, interpolation='nearest')
         gray_patch = mpatches.Patch(color='gray', label='Data present')
         white_patch = mpatches.Patch(color='white', label='Data absent ')
-        plt.xticks(rotation=45)
+        plt.xticks(range(self.df.shape[1]), self.df.columns, rotation=45, ha='right')
+        plt.ylabel(f"Row block ({len(self.df)} rows)")
         plt.title("Loan Payments Missingno Matrix")
         plt.legend(handles=[gray_patch, white_patch])
-        plt.show()
+        self._show()
     
-    def scatter_plot(self, data, column_1, column_2):
+    def scatter_plot(self, data=None, column_1='total_payment_inv', column_2='last_payment_amount', max_points=20000):
         """
         The scatter_plot function creates a scatter plot of two columns from a table, with points
-        colored and sized based on loan status and loan amount respectively.
+        colored and sized based on loan status and loan amount respectively. Tables with more than
+        `max_points` rows are drawn from a sample stratified by loan status.
         
         """
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        data = self.df if data is None else data
+        data = stratified_sample(data[list(dict.fromkeys([column_1, column_2, 'loan_status', 'loan_amount']))], 'loan_status', max_points)
         plt.figure(figsize=(10,5))
         sns.scatterplot(x= column_1, y= column_2, data=data, hue="loan_status", size="loan_amount")
         plt.xticks(rotation=45)
         plt.title("Loan Payments Scatter Plot")
-        plt.show()
+        self._show()
 
-    def histogram(Self, data, column_1):
+    def density_plot(self, data=None, column_1='total_payment_inv', column_2='last_payment_amount', bins=100):
         """
-        The function `histogram` creates a histogram plot of a specified column in a given table.
+        The function `density_plot` draws the number of loans in each cell of a `bins` x `bins` grid over
+        two columns, the scatter plot of every row without drawing every row.
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import LogNorm
+        data = self.df if data is None else data
+        counts, x_edges, y_edges = histogram_2d(data[column_1], data[column_2], bins)
+        plt.figure(figsize=(10,5))
+        plt.pcolormesh(x_edges, y_edges, counts.T, norm=LogNorm(vmin=1, vmax=max(counts.max(), 1)), cmap='viridis')
+        plt.colorbar(label='Loans')
+        plt.xlabel(column_1)
+        plt.ylabel(column_2)
+        plt.xticks(rotation=45)
+        plt.title("Loan Payments Density Plot")
+        self._show()
+
+    def histogram(self, data=None, column_1='total_payment', bins=50):
+        """
+        The function `histogram` creates a histogram plot of a specified column in a given table, with a
+        kernel density estimate computed from the binned counts.
         
         """
+        import matplotlib.pyplot as plt
+        data = self.df if data is None else data
+        counts, edges = histogram_1d(data[column_1], bins)
         plt.figure(figsize=(10,5))
-        sns.histplot(data=data, x=column_1, kde=True)
+        plt.stairs(counts, edges, fill=True, alpha=0.5)
+        plt.plot((edges[:-1] + edges[1:]) / 2, binned_kde(counts, edges))
+        plt.xlabel(column_1)
+        plt.ylabel('Count')
         plt.xticks(rotation=45)
         plt.title("Loan Payments Histogram")
-        plt.show()
+        self._show()
     
 
     def box_plot(self, column_1, column_2):
         """
-        The function `box_plot` creates a box plot of loan payments using the `sns.boxplot` function
-        from the seaborn library.
+        The function `box_plot` creates a box plot of `column_2` for each value of `column_1` from
+        precomputed quartiles and whiskers. A numeric `column_1` with many values is split into quantile
+        bins, see `plot_aggregates.box_stats`.
         """
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(15,10))
-        sns.boxplot(x= column_1 , y= column_2, data=self.df)
+        plt.gca().bxp(box_stats(self.df, column_1, column_2), showfliers=False)
+        plt.xlabel(column_1)
+        plt.ylabel(column_2)
         plt.xticks(rotation=45)
         plt.title("Loan Payments Box Plot")
-        plt.show()
-
-
-    @staticmethod
-    def pair_plot():
-        """
-        The function `pair_plot` generates a pair plot of numerical columns in a dataframe, with
-        different colors representing different grades.
-        """
-        plt.figure(figsize=(5,5))
-        sns.pairplot(df.select_dtypes(['number']), hue="loan_amount")
-        plt.title("Loan Payments Box Plot")
-        plt.show()
+        self._show()
+
+
+    def pair_plot(self, columns=None, bins=30):
+        """
+        The function `pair_plot` generates a pair plot of numerical columns in a dataframe: the
+        histogram of each column on the diagonal and the 2-D histogram of each pair of columns below it.
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import PowerNorm
+        columns = self.df.select_dtypes(['number']).columns.tolist() if columns is None else columns
+        n = len(columns)
+        fig, axes = plt.subplots(n, n, figsize=(2 * n, 2 * n), squeeze=False)
+        for i, row_col in enumerate(columns):
+            for j, col in enumerate(columns):
+                ax = axes[i, j]
+                if i == j:
+                    counts, edges = histogram_1d(self.df[col], bins)
+                    ax.stairs(counts, edges, fill=True)
+                elif i > j:
+                    counts, x_edges, y_edges = histogram_2d(self.df[col], self.df[row_col], bins)
+                    ax.pcolormesh(x_edges, y_edges, counts.T, cmap='Blues', norm=PowerNorm(0.5))
+                else:
+                    ax.axis('off')
+                ax.set_xticks([])
+                ax.set_yticks([])
+                if i == n - 1:
+                    ax.set_xlabel(col, rotation=45, ha='right')
+                if j == 0:
+                    ax.set_ylabel(row_col, rotation=0, ha='right')
+        fig.suptitle("Loan Payments Pair Plot")
+        self._show()
     
   
-    def heat_map(self, num_col):
-        """
-        The function `heat_map` generates a correlation heat map for the loan payments data.
-        """
+    def heat_map(self, num_col=None, method='pearson', workers=1):
+        """
+        The function `heat_map` generates a correlation heat map for the loan payments data, of every
+        numeric column if `num_col` is None. When the dataframe has not been loaded, the matrix is computed
+        from the snapshot in chunks (in `workers` processes) and cached for the snapshot, see
+        `correlation.cached_correlation`.
+        """
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        if self._df is None:
+            matrix = cached_correlation(self.path, num_col, method, workers)
+        else:
+            matrix = correlation_frame(self.df, num_col, method)
         plt.figure(figsize=(15,10))
-        sns.heatmap(df[num_col].corr(), annot=True, cmap="coolwarm")
+        sns.heatmap(matrix, annot=len(matrix) <= 20, cmap="coolwarm")
         plt.title("Loan Payments Correlation Heat Map")
-        plt.show()
+        self._show()
 
 
 
-class DataFrameTransform:
+@instrument
+class DataFrameTransform(LazyFrame):
     """
     The `DataFrameTransform` class provides methods for finding null values, dropping columns, imputing
     null values with mode or mean, finding skewed columns, performing log transformation, and removing
@@ -250,54 +389,57 @@ class DataFrameTransform:
     
 
     """
-    def __init__(self, df):
+    def __init__(self, df=None, path=None):
         """
         The function initializes an object with a dataframe as an attribute.
         
         :param df: The parameter "df" is a variable that represents a pandas DataFrame object. It is
-        used to store and manipulate tabular data in a structured format
+        used to store and manipulate tabular data in a structured format. If None the dataframe is
+        loaded from the snapshot at `path` when it is first used
         """
-        self.df = df
+        super().__init__(df, path)
 
     
-    @staticmethod
-    def find_nulls():
+    def find_nulls(self):
         """
         The function "find_nulls" returns the number of null values in each column of a dataframe.
         :return: the number of null values in each column of the dataframe.
         """
-        nulls_in_each_col = df.isnull().sum()
+        nulls_in_each_col = self.df.isnull().sum()
         return nulls_in_each_col
     
 
     def columns_to_drop(self, cols_for_drop):
         """
-        The function drops specified columns from a DataFrame and returns the name of the column that
-        was dropped.
+        The function drops the specified column, or list of columns, from the DataFrame.
         """
         
       
-        self.df = self.df.drop([cols_for_drop], axis=1)
+        self.df = self.df.drop(columns=cols_for_drop)
             
 
     def impute_nulls_with_mode(self, mode_impute):
         """
         The function imputes null values in a specified column of a dataframe using the mode value.
+        The columns keep their data types, see `imputation.NullImputer`.
       
+        :return: The fitted NullImputer, which can be saved and used on later batches
         """
-        mode_imputer = SimpleImputer(strategy="most_frequent")
-        self.df[mode_impute] =mode_imputer.fit_transform(self.df[mode_impute])
+        mode_imputer = NullImputer(mode_impute=mode_impute).fit_frame(self.df)
+        mode_imputer.transform(self.df)
+        return mode_imputer
 
            
     def impute_nulls_with_median(self,  median_impute):
         """
-        The function imputes null values in a specified column with the mean value.
-        
+        The function imputes null values in a specified column with the median value.
+        The columns keep their data types, see `imputation.NullImputer`.
     
+        :return: The fitted NullImputer, which can be saved and used on later batches
         """
-        
-        median_imputer = SimpleImputer(strategy="median")
-        self.df[median_impute] = median_imputer.fit_transform(self.df[median_impute])
+        median_imputer = NullImputer(median_impute=median_impute).fit_frame(self.df)
+        median_imputer.transform(self.df)
+        return median_imputer
             
 
     def find_skewed_cols(self, num_col):
@@ -305,30 +447,39 @@ class DataFrameTransform:
         The function "find_skewed_cols" identifies columns in a DataFrame that have a skewness value
         greater than 1 or less than -1.
         """
-        list_of_skew = self.df[num_col].skew()
-        skew_cols = [col for col in list_of_skew if col <-1 or col >1]
+        skew_cols = SkewTransformer.find_skewed(self.df, num_col, threshold=1)
         return skew_cols
 
-    def log_transformation(self, skewed_cols):
-        for col in skewed_cols: 
-            self.df[col].map(lambda i: np.log(i) if i > 0 else 0)
+    def log_transformation(self, skewed_cols, method='log'):
+        """
+        The function transforms the skewed columns in place, by default with the log of positive values
+        and 0 for the rest. `method` can also be 'log1p', 'boxcox' or 'yeojohnson', see
+        `skew_transform.SkewTransformer`.
+        
+        :return: The fitted SkewTransformer, which can be saved and replayed on new data
+        """
+        transformer = SkewTransformer(method).fit(self.df, skewed_cols)
+        transformer.transform(self.df)
+        return transformer
 
 
-    def remove_outliers(self, num_col):
+    def remove_outliers(self, num_col, threshold=1.5, policies=None):
         """
         The function removes outliers from numerical columns in a DataFrame using the interquartile
-        range method.
-        """
-        Q1 = self.df[num_col].quantile(0.25)
-        Q3 = self.df[num_col].quantile(0.75)
-        IQR = Q3 - Q1
-        threshold = 1.5
-        outliers = self.df[(self.df[num_col] < Q1 - threshold * IQR) | (self.df[num_col] > Q3 + threshold * IQR)]
-        self.df = self.df.drop(outliers.index)
+        range method. A row is removed when any of its columns is below Q1 - threshold * IQR or above
+        Q3 + threshold * IQR. `policies` can give columns their own fences, see `outliers.OutlierFilter`.
+        
+        :return: The fitted OutlierFilter, with the fences and the number of rows removed
+        """
+        outlier_filter = OutlierFilter(num_col, threshold, policies).fit_frame(self.df)
+        self.df = outlier_filter.filter(self.df)
+        return outlier_filter
         
 
 
 if __name__ == '__main__':
+    enable_from_environment()
+    df = load_snapshot(stage_path('transformed_loan_payments', 'arrow'))
     information = DataFrameInfo(df)
     plot = plotter(df)
     transform = DataFrameTransform(df)
@@ -348,12 +499,12 @@ if __name__ == '__main__':
     
     information.df_shape()
     information.df_information()
-    information.Extract_stats()
+    print(information.profile().to_string())
     information.distinct_values_categories()
-    information.null_count() 
 
     plot.msno_matrix()
     plot.scatter_plot(df, 'total_payment_inv', 'last_payment_amount')
+    plot.density_plot(df, 'total_payment_inv', 'last_payment_amount')
     plot.histogram(df, 'total_payment')
     plot.box_plot('instalment','int_rate')
     plot.pair_plot()
@@ -363,8 +514,10 @@ if __name__ == '__main__':
     transform.columns_to_drop(cols_for_drop)
     transform.impute_nulls_with_mode(mode_impute)
     transform.impute_nulls_with_median(median_impute)
-    transform.find_skewed_cols(num_col)
+    #the loss analysis reads the imputed table, before the skew and outlier steps change the monetary columns
+    save_snapshot(transform.df, stage_path('cleaned_loan_payments', 'arrow'))
+    transform.find_skewed_cols(transform.df.select_dtypes(include='number').columns.tolist())
     transform.log_transformation(skewed_cols)
-    transform.remove_outliers(num_col)
+    transform.remove_outliers(transform.df.select_dtypes(include='number').columns.tolist())
 
-df.to_csv('EDA_Frameinfo_loan_payments.csv')
\ No newline at end of file
+    save_snapshot(transform.df, stage_path('EDA_Frameinfo_loan_payments', 'arrow'))
\ No newline at end of file
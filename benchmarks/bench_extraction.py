@@ -0,0 +1,63 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_utils import RDSDatabaseConnector
+from synthetic_loans import generate_loan_chunks
+
+
+def build_sqlite_stand_in(path, n_rows, seed=0, chunksize=1000000):
+    """
+    The function writes a synthetic loan_payments table to a local SQLite file, one generated chunk at a
+    time, and returns credentials for it in the same format as credentials.yaml.
+    """
+    engine = create_engine(f"sqlite+pysqlite:///{path}")
+    for chunk in generate_loan_chunks(n_rows, chunksize, seed):
+        chunk.to_sql('loan_payments', engine, index=False, chunksize=50000, if_exists='append')
+    with engine.begin() as connection:
+        #stands in for the primary key on the real table
+        connection.execute(text("CREATE UNIQUE INDEX loan_payments_id ON loan_payments (id)"))
+    engine.dispose()
+    return {'DATABASE_TYPE': 'sqlite', 'DBAPI': 'pysqlite', 'DATABASE': path}
+
+
+def time_call(function, repeats):
+    """
+    The function runs `function` `repeats` times and returns the best wall time in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare single-query and partitioned extraction")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        credentials = build_sqlite_stand_in(os.path.join(directory, 'loan_payments.db'), args.rows)
+
+        connector = RDSDatabaseConnector(credentials)
+        single = time_call(lambda: connector.database_extraction('loan_payments'), args.repeats)
+        print(f"single query: {single:.3f}s")
+
+        for use_processes in (False, True):
+            for workers in args.workers:
+                connector = RDSDatabaseConnector(credentials)
+                partitioned = time_call(lambda: connector.partitioned_extraction('loan_payments', 'id', partitions=workers * 2,
+                                                                                workers=workers, use_processes=use_processes), args.repeats)
+                kind = 'processes' if use_processes else 'threads'
+                print(f"partitioned, {workers} {kind}: {partitioned:.3f}s ({single / partitioned:.2f}x)")
+                connector.engine.dispose()
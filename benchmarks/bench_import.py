@@ -0,0 +1,30 @@
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#modules a worker process imports, pandas alone is the baseline they can't go below
+MODULES = ['pandas', 'EDA', 'EDA_DataFrameInfo', 'db_utils', 'profiling', 'pipeline']
+
+
+def import_time(module, repeats):
+    """
+    The function returns the best time in ms, over `repeats` fresh interpreters, to import `module`.
+    """
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+        times.append(float(output.stdout.strip()) * 1000)
+    return min(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time importing each module in a fresh interpreter")
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    for module in MODULES:
+        print(f"{module}: {import_time(module, args.repeats):.0f}ms")
@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_extraction import build_sqlite_stand_in, time_call
+from db_utils import RDSDatabaseConnector
+from EDA import transform_loan_payments
+from profiling import profile_chunks
+
+
+#columns read by the loss analysis in Analysis_visualisation.ipynb
+LOSS_COLUMNS = ['loan_status', 'loan_amount', 'funded_amount', 'funded_amount_inv', 'term', 'int_rate', 'instalment',
+                'total_payment', 'total_payment_inv', 'out_prncp', 'out_prncp_inv', 'recoveries', 'issue_date']
+
+
+def frame_mb(df):
+    """
+    The function returns the memory of a dataframe in MB, a stand-in for the bytes sent by the database.
+    """
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare client-side conversions and statistics with SQL pushdown")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        credentials = build_sqlite_stand_in(os.path.join(directory, 'loan_payments.db'), args.rows)
+        connector = RDSDatabaseConnector(credentials)
+
+        raw = connector.database_extraction('loan_payments')
+        projected = connector.pushdown_extraction('loan_payments', LOSS_COLUMNS)
+        print(f"all columns: {raw.shape[1]} columns, {frame_mb(raw):.1f} MB; "
+              f"loss columns pushed down: {projected.shape[1]} columns, {frame_mb(projected):.1f} MB")
+
+        client = time_call(lambda: transform_loan_payments(connector.database_extraction('loan_payments'))[LOSS_COLUMNS], args.repeats)
+        pushed = time_call(lambda: connector.pushdown_extraction('loan_payments', LOSS_COLUMNS), args.repeats)
+        print(f"extract + convert loss columns: client {client:.3f}s, pushdown {pushed:.3f}s ({client / pushed:.2f}x)")
+
+        client = time_call(lambda: profile_chunks([transform_loan_payments(connector.database_extraction('loan_payments'))]).summary(),
+                           args.repeats)
+        pushed = time_call(lambda: connector.pushdown_summary('loan_payments'), args.repeats)
+        print(f"column summary: client {client:.3f}s, pushdown {pushed:.3f}s ({client / pushed:.2f}x)")
+        #SQLite runs in this process, so its times include the work a database server would do elsewhere
+        connector.engine.dispose()
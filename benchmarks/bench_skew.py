@@ -0,0 +1,42 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from skew_transform import SkewTransformer
+from synthetic_loans import generate_loan_payments
+
+#the skewed columns listed in EDA_DataFrameInfo.py
+skewed_cols = ['annual_inc', 'delinq_2yrs', 'inq_last_6mths', 'open_accounts', 'out_prncp', 'out_prncp_inv', 'total_payment',
+               'total_payment_inv', 'total_rec_prncp', 'total_rec_int', 'total_rec_late_fee', 'recoveries',
+               'collection_recovery_fee', 'last_payment_amount', 'collections_12_mths_ex_med']
+
+
+def lambda_log_transformation(df):
+    """
+    The per element transform previously used by `DataFrameTransform.log_transformation`.
+    """
+    for col in skewed_cols:
+        df[col] = df[col].map(lambda i: np.log(i) if i > 0 else 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the per element lambda log transform with SkewTransformer")
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    df = generate_loan_payments(args.rows)
+
+    start = time.perf_counter()
+    lambda_log_transformation(df.copy())
+    print(f"Series.map lambda: {time.perf_counter() - start:.3f}s")
+
+    for method in ('log', 'log1p', 'yeojohnson'):
+        copy = df.copy()
+        start = time.perf_counter()
+        SkewTransformer(method).fit(copy, skewed_cols).transform(copy)
+        print(f"SkewTransformer {method}: {time.perf_counter() - start:.3f}s")
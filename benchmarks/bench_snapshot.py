@@ -0,0 +1,60 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from EDA import transform_loan_payments
+from storage import load_frame, open_snapshot, save_frame, save_snapshot
+from synthetic_loans import generate_loan_payments
+
+
+def proportional_memory_mb():
+    """
+    The function returns the proportional set size (PSS) of this process in MB. Unlike RSS, PSS splits
+    pages shared between processes, such as a memory-mapped snapshot, across the processes sharing them.
+    """
+    with open('/proc/self/smaps_rollup') as r:
+        for line in r:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def read_in_worker(loader, path):
+    """
+    The function opens the file the way an analysis worker would and touches one numeric column.
+    """
+    start = time.perf_counter()
+    if loader == 'parquet':
+        df = load_frame(path)
+        total = df['loan_amount'].sum()
+    else:
+        table = open_snapshot(path)
+        total = table.column('loan_amount').to_numpy().sum()
+    opened = time.perf_counter() - start
+    return opened, proportional_memory_mb(), total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare Parquet loading with memory-mapped Arrow snapshots")
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    df = transform_loan_payments(generate_loan_payments(args.rows))
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {'parquet': os.path.join(directory, 'snapshot.parquet'), 'arrow': os.path.join(directory, 'snapshot.arrow')}
+        save_frame(df, paths['parquet'])
+        save_snapshot(df, paths['arrow'])
+        del df
+
+        for loader, path in paths.items():
+            with multiprocessing.get_context('spawn').Pool(args.workers) as pool:
+                results = pool.starmap(read_in_worker, [(loader, path)] * args.workers)
+            opened = max(result[0] for result in results)
+            memory = sum(result[1] for result in results)
+            print(f"{loader}: slowest open {opened * 1000:.1f}ms, total PSS of {args.workers} workers {memory:.0f}MB")
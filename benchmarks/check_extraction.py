@@ -0,0 +1,124 @@
+import argparse
+import os
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_extraction import build_sqlite_stand_in
+from check_sketches import check
+from db_utils import RDSDatabaseConnector, load_sync_state, save_sync_state
+from storage import load_frame
+from synthetic_loans import generate_loan_payments
+
+
+def update_loans(engine, ids, month):
+    """
+    The function changes loans in the stand-in the way a new payment does: the last payment date moves to
+    `month` and the total payment goes up.
+    """
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE loan_payments SET last_payment_date = :month, total_payment = total_payment + 100 "
+                                "WHERE id IN (" + ', '.join(str(int(key)) for key in ids) + ")"), {'month': month})
+
+
+def compare_with_table(failures, name, df, table, columns):
+    """
+    The function checks that a frame holds the rows of the table: the same number of rows, no repeated
+    id, the same ids and the same values of `columns`.
+    """
+    check(failures, f"{name}: row count", len(df) == len(table), f"({len(df)} rows, table {len(table)})")
+    check(failures, f"{name}: unique ids", df['id'].is_unique)
+    check(failures, f"{name}: same ids", set(df['id']) == set(table['id']))
+    merged = table[['id'] + columns].merge(df[['id'] + columns], on='id', how='left', suffixes=('', '_read'))
+    for col in columns:
+        same = (merged[col].isna() & merged[f"{col}_read"].isna()) | (merged[col] == merged[f"{col}_read"])
+        check(failures, f"{name}: same {col}", bool(same.all()), f"({int((~same).sum())} rows differ)")
+
+
+def check_partitioned_extraction(failures, credentials, partitions, workers):
+    """
+    The function checks that `partitioned_extraction` returns every row of the table once, without the
+    warning of partitions not adding up to the row count, when splitting on the key, on a month text
+    column and on a month text column with nulls, with threads and with processes.
+    """
+    connector = RDSDatabaseConnector(credentials)
+    table = connector.database_extraction('loan_payments')
+    for column in ['id', 'issue_date', 'last_payment_date']:
+        for use_processes in [False, True]:
+            name = f"partitions of {column} ({'processes' if use_processes else 'threads'})"
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                df = connector.partitioned_extraction('loan_payments', column, partitions, workers, use_processes)
+            check(failures, f"{name}: no warning", not caught, '; '.join(str(warning.message) for warning in caught))
+            compare_with_table(failures, name, df, table, [col for col in [column, 'loan_amount'] if col != 'id'])
+    connector.engine.dispose()
+
+
+def check_incremental_sync(failures, credentials, directory, seed):
+    """
+    The function checks that `incremental_sync` fetches loans whose month text watermark moves past the
+    stored one across a year boundary, 'Sep-2022' to 'Dec-2022' and 'Jan-2023', which sort before it as
+    text, then 'Feb-2023' on the next sync, and that the snapshot ends up equal to the table each time.
+    """
+    engine = create_engine(f"sqlite+pysqlite:///{credentials['DATABASE']}")
+    with engine.begin() as connection:
+        #the synthetic months run to Dec-2022, the watermark starts at Sep-2022
+        connection.execute(text("UPDATE loan_payments SET last_payment_date = 'Sep-2022' "
+                                "WHERE last_payment_date IN ('Oct-2022', 'Nov-2022', 'Dec-2022')"))
+    connector = RDSDatabaseConnector(credentials)
+    snapshot_path = os.path.join(directory, 'loan_payments.parquet')
+    state_path = os.path.join(directory, 'sync_state.yaml')
+    connector.incremental_sync('loan_payments', snapshot_path, state_path)
+    #a state file written before month watermarks were stored as month numbers holds the text
+    state = load_sync_state(state_path)
+    check(failures, "first sync: watermark is a month number", isinstance(state['watermark'], int), f"({state['watermark']!r})")
+    save_sync_state(state_path, dict(state, watermark='Sep-2022'))
+
+    rng = np.random.default_rng(seed)
+    table = connector.database_extraction('loan_payments')
+    last_id = int(table['id'].max())
+    for number, months in enumerate([['Dec-2022', 'Jan-2023'], ['Feb-2023']]):
+        changed = rng.choice(table['id'].to_numpy(), 100 * len(months), replace=False)
+        for ids, month in zip(np.array_split(changed, len(months)), months):
+            update_loans(engine, ids, month)
+        new = generate_loan_payments(50, seed=seed + number + 1, start_id=last_id + 1)
+        new['last_payment_date'] = months[-1]
+        new.to_sql('loan_payments', engine, index=False, if_exists='append')
+        last_id += len(new)
+
+        fetched = connector.incremental_sync('loan_payments', snapshot_path, state_path)
+        table = connector.database_extraction('loan_payments')
+        name = f"sync to {months[-1]}"
+        check(failures, f"{name}: changed and new loans fetched", fetched >= len(changed) + len(new),
+              f"({fetched} rows, {len(changed) + len(new)} changed or new)")
+        compare_with_table(failures, name, load_frame(snapshot_path), table, ['last_payment_date', 'total_payment'])
+    engine.dispose()
+    connector.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check incremental and partitioned extraction against a SQLite stand-in")
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--partitions', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        credentials = build_sqlite_stand_in(os.path.join(directory, 'loan_payments.db'), args.rows, args.seed)
+        print("-- partitioned_extraction")
+        check_partitioned_extraction(failures, credentials, args.partitions, args.workers)
+        #the sync checks change the table, so they run last
+        print("-- incremental_sync")
+        check_incremental_sync(failures, credentials, directory, args.seed)
+
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("all checks passed")
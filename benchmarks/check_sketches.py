@@ -0,0 +1,205 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from correlation import CorrelationAccumulator
+from profiling import StreamingProfiler, parallel_profile_chunks
+from sketches import DistinctCounter, FrequencyCounter, Moments, QuantileSketch
+from synthetic_loans import generate_loan_payments
+
+#statistics that are exact up to floating point rounding are compared with this relative tolerance
+RTOL = 1e-9
+
+
+def split(values, n_chunks, rng):
+    """
+    The function splits an array or DataFrame into `n_chunks` parts of random sizes, in order.
+    """
+    edges = np.sort(rng.choice(np.arange(1, len(values)), n_chunks - 1, replace=False))
+    edges = np.concatenate([[0], edges, [len(values)]])
+    return [values[start:stop] for start, stop in zip(edges[:-1], edges[1:])]
+
+
+def check(failures, name, passed, detail=''):
+    """
+    The function prints the result of a check and keeps the name of the checks that failed.
+    """
+    print(f"{'ok  ' if passed else 'FAIL'} {name} {detail}")
+    if not passed:
+        failures.append(name)
+
+
+def check_moments(failures, values, chunks):
+    """
+    The function checks the count, mean, variance, minimum and maximum of Moments merged from chunks
+    against one pass and against numpy.
+    """
+    single = Moments()
+    single.update(values)
+    merged = Moments()
+    for chunk in chunks:
+        part = Moments()
+        part.update(chunk)
+        merged.merge(part)
+    for name, moments in [('single', single), ('merged', merged)]:
+        passed = moments.count == len(values) and moments.min == values.min() and moments.max == values.max() \
+            and np.isclose(moments.mean, values.mean(), rtol=RTOL) and np.isclose(moments.variance(), values.var(ddof=1), rtol=RTOL)
+        check(failures, f"Moments {name} = numpy", passed)
+    check(failures, "Moments merged = single", merged.count == single.count and np.isclose(merged.mean, single.mean, rtol=RTOL)
+          and np.isclose(merged.variance(), single.variance(), rtol=RTOL))
+
+
+def check_correlation(failures, df, chunks):
+    """
+    The function checks the correlation of accumulators merged from chunks against one accumulator and
+    against `DataFrame.corr()`, and the number of rows of each pair against a count of the present rows.
+    """
+    columns = list(df.columns)
+    expected = df.corr()
+    single = CorrelationAccumulator(columns).update(df)
+    merged = CorrelationAccumulator(columns)
+    for chunk in chunks:
+        merged.merge(CorrelationAccumulator(columns).update(chunk))
+    present = df.notna().astype('int64')
+    for name, accumulator in [('single', single), ('merged', merged)]:
+        error = (accumulator.correlation() - expected).abs().max().max()
+        check(failures, f"CorrelationAccumulator {name} = DataFrame.corr()", error < 1e-9, f"(max difference {error:.1e})")
+        check(failures, f"CorrelationAccumulator {name} pair counts", accumulator.pair_counts().equals(present.T @ present))
+
+
+def rank_error(sketch, values, qs):
+    """
+    The function returns the largest rank error of the sketch's quantiles and ranks: for `quantile` the
+    distance from q to the range of exact ranks of the estimated value, and for `rank` the distance of
+    the estimated rank from the exact one.
+    """
+    ordered = np.sort(values)
+    n = len(ordered)
+    estimates = sketch.quantile(qs)
+    low = np.searchsorted(ordered, estimates, side='left') / n
+    high = np.searchsorted(ordered, estimates, side='right') / n
+    quantile_error = np.max(np.maximum(low - qs, 0) + np.maximum(qs - high, 0))
+    points = np.quantile(ordered, qs)
+    exact = (np.searchsorted(ordered, points, side='left') + np.searchsorted(ordered, points, side='right')) / (2 * n)
+    rank_error = np.max(np.abs(sketch.rank(points) - exact))
+    return max(quantile_error, rank_error)
+
+
+def check_quantiles(failures, values, chunks, k, seed):
+    """
+    The function checks that the rank error of a QuantileSketch built in one pass and one merged from
+    chunks is within 2/k.
+    """
+    qs = np.linspace(0.001, 0.999, 999)
+    single = QuantileSketch(k, seed=seed)
+    single.update(values)
+    merged = QuantileSketch(k, seed=seed)
+    for i, chunk in enumerate(chunks):
+        part = QuantileSketch(k, seed=seed + i + 1)
+        part.update(chunk)
+        merged.merge(part)
+    check(failures, "QuantileSketch merged count", merged.count == len(values))
+    for name, sketch in [('single', single), ('merged', merged)]:
+        error = rank_error(sketch, values, qs)
+        check(failures, f"QuantileSketch {name} rank error <= 2/k", error <= 2 / k, f"({error:.4f}, 2/k = {2 / k:.4f})")
+
+
+def check_distinct(failures, values, chunks, precision):
+    """
+    The function checks that a DistinctCounter merged from chunks gives the same count as one pass, and
+    that the count is within four standard errors of the exact count.
+    """
+    single = DistinctCounter(precision)
+    single.update(pd.Series(values))
+    merged = DistinctCounter(precision)
+    for chunk in chunks:
+        part = DistinctCounter(precision)
+        part.update(pd.Series(chunk))
+        merged.merge(part)
+    exact = len(np.unique(values))
+    bound = 4 * 1.04 / np.sqrt(2 ** precision)
+    error = abs(merged.count() - exact) / exact
+    check(failures, "DistinctCounter merged = single", merged.count() == single.count())
+    check(failures, "DistinctCounter relative error", error <= bound, f"({error:.4f}, bound {bound:.4f})")
+
+
+def check_frequencies(failures, values, chunks, capacity):
+    """
+    The function checks that each count of a FrequencyCounter merged from chunks is at most `error` below
+    the true count, that the error is at most rows / (capacity + 1), and that no count is too high.
+    """
+    merged = FrequencyCounter(capacity)
+    for chunk in chunks:
+        part = FrequencyCounter(capacity)
+        part.update(pd.Series(chunk))
+        merged.merge(part)
+    exact = pd.Series(values).value_counts()
+    counts = pd.Series(merged.counts, dtype='int64')
+    below = exact[counts.index] - counts
+    passed = merged.error <= len(values) / (capacity + 1) and below.min() >= 0 and below.max() <= merged.error
+    check(failures, "FrequencyCounter counts within error", passed, f"(error {merged.error}, bound {len(values) / (capacity + 1):.0f})")
+    #values more frequent than the error must be kept
+    check(failures, "FrequencyCounter keeps the frequent values", set(exact[exact > merged.error].index) <= set(counts.index))
+
+
+def check_profiler(failures, df, chunksize, workers):
+    """
+    The function checks that the exact statistics of a StreamingProfiler merged from chunks, in a process
+    pool, match one pass and `DataFrame.describe()`.
+    """
+    chunks = [df.iloc[start:start + chunksize] for start in range(0, len(df), chunksize)]
+    single = StreamingProfiler().update(df).summary()
+    merged = parallel_profile_chunks(chunks, workers).summary()
+    exact_columns = [col for col in ['count', 'nulls', 'min', 'max', 'freq'] if col in single]
+    equal = single[exact_columns].fillna(-1).astype(str).equals(merged[exact_columns].fillna(-1).astype(str))
+    check(failures, f"StreamingProfiler merged = single ({', '.join(exact_columns)})", equal)
+    numeric = df.select_dtypes(include='number')
+    expected = numeric.describe().T
+    for name, summary in [('single', single), ('merged', merged)]:
+        rows = summary.loc[numeric.columns]
+        passed = (rows['count'].astype('int64') == expected['count'].astype('int64')).all() \
+            and np.allclose(rows['mean'].astype('float64'), expected['mean'], rtol=RTOL) \
+            and np.allclose(rows['std'].astype('float64'), expected['std'], rtol=RTOL, equal_nan=True) \
+            and (rows['min'].astype('float64') == expected['min']).all() and (rows['max'].astype('float64') == expected['max']).all()
+        check(failures, f"StreamingProfiler {name} = DataFrame.describe()", passed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check merged sketches against one pass and their error bounds")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--chunks', type=int, default=16)
+    parser.add_argument('--k', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    failures = []
+    #a skewed, a heavily tied and an already sorted stream
+    streams = {'lognormal': rng.lognormal(8, 1.5, args.rows), 'tied': rng.integers(0, 50, args.rows).astype('float64'),
+               'sorted': np.sort(rng.normal(0, 1, args.rows))}
+    for name, values in streams.items():
+        print(f"-- {name}")
+        chunks = split(values, args.chunks, rng)
+        check_moments(failures, values, chunks)
+        check_quantiles(failures, values, chunks, args.k, args.seed)
+    print("-- distinct and frequent values")
+    values = rng.zipf(1.3, args.rows)
+    chunks = split(values, args.chunks, rng)
+    check_distinct(failures, values, chunks, 14)
+    check_frequencies(failures, values, chunks, 1000)
+    print("-- loan_payments")
+    loans = generate_loan_payments(args.rows // 4, seed=args.seed)
+    numeric = loans.select_dtypes(include='number')
+    check_correlation(failures, numeric, split(numeric, args.chunks, rng))
+    check_profiler(failures, loans, max(1, len(loans) // args.chunks), args.workers)
+
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("all checks passed")
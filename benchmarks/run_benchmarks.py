@@ -0,0 +1,252 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_extraction import build_sqlite_stand_in
+from db_utils import RDSDatabaseConnector
+from EDA import DataTransform, loan_payments_schema, transform_loan_payments
+from EDA_DataFrameInfo import DataFrameInfo, DataFrameTransform
+import portfolio
+from synthetic_loans import generate_loan_chunks
+
+
+#column lists the stages are called with, as in EDA.py and EDA_DataFrameInfo.py
+CATEGORIES = [col for col, spec in loan_payments_schema.items() if spec.get('dtype') == 'category']
+DATES = [col for col, spec in loan_payments_schema.items() if spec.get('dtype') == 'month']
+EXCESS_DP = [col for col, spec in loan_payments_schema.items() if 'round' in spec]
+FLOATS = [col for col, spec in loan_payments_schema.items() if spec.get('dtype') == 'int64']
+MODE_IMPUTE = ['last_credit_pull_date', 'next_payment_date', 'last_payment_date', 'employment_length', 'term']
+MEDIAN_IMPUTE = ['collections_12_mths_ex_med', 'mths_since_last_delinq', 'int_rate', 'funded_amount']
+SKEWED_COLS = ['annual_inc', 'delinq_2yrs', 'inq_last_6mths', 'open_accounts', 'out_prncp', 'out_prncp_inv', 'total_payment',
+               'total_payment_inv', 'total_rec_prncp', 'total_rec_int', 'total_rec_late_fee', 'recoveries',
+               'collection_recovery_fee', 'last_payment_amount', 'collections_12_mths_ex_med']
+COLS_FOR_DROP = ['mths_since_last_record', 'mths_since_last_major_derog']
+
+
+def notebook_loss_loops(df):
+    """
+    The function repeats the loss calculations of Analysis_visualisation.ipynb as they were written before
+    `portfolio`, with Python loops over loan_status and a filter per status, as the baseline of the
+    portfolio benchmarks.
+    """
+    fully_paid = [status for status in df['loan_status'] if status == 'Fully Paid']
+    charged_off = [status for status in df['loan_status'] if status == 'Charged Off']
+    filter_charged_off = df[df['loan_status'] == 'Charged Off']
+    filter_late = df[df['loan_status'] == 'Late (31-120 days)']
+    instalments_paid = filter_late['total_payment'] / filter_late['instalment']
+    return {
+        'recovered_inv': sum(df['out_prncp_inv']) / sum(df['funded_amount_inv']) * 100,
+        'recovered': sum(df['out_prncp']) / sum(df['funded_amount']) * 100,
+        'fully_paid': len(fully_paid),
+        'charged_off': len(charged_off) / len(df) * 100,
+        'expected_revenue': sum(filter_charged_off['instalment']) * sum(filter_charged_off['term']),
+        'possible_loss': sum(filter_late['term'] / instalments_paid * filter_late['instalment']),
+    }
+
+
+def measure(function, setup=None, repeats=3):
+    """
+    The function times `function(setup())` `repeats` times, the setup (e.g. copying the input frame) is
+    not timed, then runs it once more with tracemalloc on to find the peak memory it allocates. Anything
+    printed by the function is discarded.
+
+    :return: Dictionary of the best, mean and all wall times in seconds, the peak traced memory in MB and
+    the peak resident memory of the process so far in MB
+    """
+    seconds = []
+    for _ in range(repeats):
+        argument = setup() if setup else None
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function(argument)
+            seconds.append(time.perf_counter() - start)
+    argument = setup() if setup else None
+    #the timed runs are done without tracemalloc, which slows every allocation down
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            function(argument)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    #ru_maxrss is in KB on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+    return {'best_seconds': min(seconds), 'mean_seconds': float(np.mean(seconds)), 'seconds': seconds,
+            'peak_traced_mb': peak / 1024 ** 2, 'max_rss_mb': max_rss}
+
+
+def benchmark_cases(raw, transformed, credentials):
+    """
+    The function lists the benchmarks as (group, name, setup, function). `raw` is the table as extracted
+    and `transformed` the table after `transform_loan_payments`, stages that change their input get a
+    copy from `setup` so every run starts from the same frame.
+    """
+    def raw_transform():
+        return DataTransform(raw.copy())
+
+    def frame_transform():
+        return DataFrameTransform(transformed.copy())
+
+    #term_to_int casts to int, so it is timed on terms without nulls
+    def complete_terms():
+        df = raw.copy()
+        df['term'] = df['term'].fillna('36 months')
+        return DataTransform(df)
+
+    information = DataFrameInfo(transformed)
+    #the notebook read the table after the term was converted to a number of months
+    numeric_terms = transformed.assign(term=portfolio.term_months(transformed['term']))
+    connector = RDSDatabaseConnector(credentials)
+    status = portfolio.status_summary(transformed)
+    return [
+        ('RDSDatabaseConnector', 'database_extraction', None, lambda _: connector.database_extraction('loan_payments')),
+        ('RDSDatabaseConnector', 'pushdown_extraction', None, lambda _: connector.pushdown_extraction('loan_payments')),
+        ('DataTransform', 'object_to_category', raw_transform, lambda t: t.object_to_category(CATEGORIES)),
+        ('DataTransform', 'object_to_date', raw_transform, lambda t: t.object_to_date(DATES)),
+        ('DataTransform', 'round_floats', raw_transform, lambda t: t.round_floats(EXCESS_DP)),
+        ('DataTransform', 'float_to_int', raw_transform, lambda t: t.float_to_int(FLOATS)),
+        ('DataTransform', 'object_to_bool', raw_transform, lambda t: t.object_to_bool('payment_plan')),
+        ('DataTransform', 'term_to_int', complete_terms, lambda t: t.term_to_int()),
+        ('DataTransform', 'apply_schema', raw_transform, lambda t: t.apply_schema(loan_payments_schema)),
+        ('DataTransform', 'optimise_memory', raw_transform, lambda t: t.optimise_memory()),
+        ('DataFrameInfo', 'df_shape', None, lambda _: information.df_shape()),
+        ('DataFrameInfo', 'df_information', None, lambda _: information.df_information()),
+        ('DataFrameInfo', 'Extract_stats', None, lambda _: information.Extract_stats()),
+        ('DataFrameInfo', 'distinct_values_categories', None, lambda _: information.distinct_values_categories()),
+        ('DataFrameInfo', 'null_count', None, lambda _: information.null_count()),
+        ('DataFrameInfo', 'profile', None, lambda _: information.profile()),
+        ('DataFrameTransform', 'find_nulls', frame_transform, lambda t: t.find_nulls()),
+        ('DataFrameTransform', 'columns_to_drop', frame_transform, lambda t: t.columns_to_drop(COLS_FOR_DROP)),
+        ('DataFrameTransform', 'impute_nulls_with_mode', frame_transform, lambda t: t.impute_nulls_with_mode(MODE_IMPUTE)),
+        ('DataFrameTransform', 'impute_nulls_with_median', frame_transform, lambda t: t.impute_nulls_with_median(MEDIAN_IMPUTE)),
+        ('DataFrameTransform', 'find_skewed_cols', frame_transform,
+         lambda t: t.find_skewed_cols(t.df.select_dtypes(include='number').columns.tolist())),
+        ('DataFrameTransform', 'log_transformation', frame_transform, lambda t: t.log_transformation(SKEWED_COLS)),
+        ('DataFrameTransform', 'remove_outliers', frame_transform,
+         lambda t: t.remove_outliers(t.df.select_dtypes(include='number').columns.tolist())),
+        ('notebook', 'loss_loops', None, lambda _: notebook_loss_loops(numeric_terms)),
+        ('notebook', 'status_summary', None, lambda _: portfolio.status_summary(transformed)),
+        ('notebook', 'loss_summary', None, lambda _: portfolio.loss_summary(status)),
+        ('notebook', 'projected_payments', None, lambda _: portfolio.projected_payments(transformed)),
+        ('notebook', 'amortization_schedule', None, lambda _: portfolio.amortization_schedule(transformed)),
+        ('notebook', 'recovery_projection', None, lambda _: portfolio.recovery_projection(transformed)),
+    ]
+
+
+def run_benchmarks(n_rows, seed=0, repeats=3, only=None, directory=None):
+    """
+    The function generates a synthetic table of `n_rows` loans, writes it to a SQLite stand-in for the
+    database and runs every benchmark whose 'group.name' matches the regular expression `only`. A stage
+    that fails is recorded with its error instead of stopping the run.
+
+    :return: List of result dictionaries
+    """
+    with tempfile.TemporaryDirectory(dir=directory) as temporary:
+        credentials = build_sqlite_stand_in(os.path.join(temporary, 'loan_payments.db'), n_rows, seed)
+        raw = pd.concat(generate_loan_chunks(n_rows, seed=seed), ignore_index=True)
+        transformed = transform_loan_payments(raw.copy())
+        results = []
+        for group, name, setup, function in benchmark_cases(raw, transformed, credentials):
+            if only and not re.search(only, f"{group}.{name}"):
+                continue
+            result = {'group': group, 'benchmark': name, 'rows': n_rows}
+            try:
+                result.update(measure(function, setup, repeats))
+            except Exception as error:
+                result['error'] = f"{type(error).__name__}: {error}"
+            results.append(result)
+            print(f"{n_rows} rows {group}.{name}: " +
+                  (f"{result['best_seconds']:.4f}s, {result['peak_traced_mb']:.1f} MB" if 'error' not in result else result['error']))
+    return results
+
+
+def run_metadata(rows, seed, repeats):
+    """
+    The function records what the results depend on: the commit, whether the tree had changes, the
+    versions of Python and the libraries, the machine and the arguments.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def git(*command):
+        try:
+            return subprocess.run(['git', *command], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    import sqlalchemy
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'sqlalchemy': sqlalchemy.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'rows': list(rows),
+        'seed': seed,
+        'repeats': repeats,
+    }
+
+
+def compare_results(baseline, current):
+    """
+    The function lines up two results files by benchmark and row count.
+
+    :return: A DataFrame with the best seconds and peak memory of both runs and their ratios
+    (current / baseline, below 1 is faster or smaller)
+    """
+    def table(results):
+        frame = pd.DataFrame(results['results'])
+        for col in ['best_seconds', 'peak_traced_mb']:
+            if col not in frame:
+                frame[col] = np.nan
+        return frame.set_index(['group', 'benchmark', 'rows'])[['best_seconds', 'peak_traced_mb']]
+
+    comparison = table(baseline).join(table(current), how='outer', lsuffix='_baseline', rsuffix='_current')
+    comparison['time_ratio'] = comparison['best_seconds_current'] / comparison['best_seconds_baseline']
+    comparison['memory_ratio'] = comparison['peak_traced_mb_current'] / comparison['peak_traced_mb_baseline']
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time and measure the memory of every stage on synthetic loan_payments tables")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--only', help="regular expression matched against group.benchmark, e.g. 'DataTransform|notebook'")
+    parser.add_argument('--output', help="results file, by default benchmarks/results/<commit>.json")
+    parser.add_argument('--compare', help="results file of an earlier run to compare with")
+    parser.add_argument('--directory', help="directory for the SQLite stand-in, the default temporary directory if not given")
+    args = parser.parse_args()
+
+    metadata = run_metadata(args.rows, args.seed, args.repeats)
+    results = [result for n_rows in args.rows for result in run_benchmarks(n_rows, args.seed, args.repeats, args.only, args.directory)]
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+                                         f"{(metadata['commit'] or 'unknown')[:12]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as w:
+        json.dump({'metadata': metadata, 'results': results}, w, indent=1)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as r:
+            baseline = json.load(r)
+        print(compare_results(baseline, {'metadata': metadata, 'results': results}).to_string(float_format='{:.3f}'.format))
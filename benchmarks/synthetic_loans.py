@@ -0,0 +1,147 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import save_chunks
+
+
+#value -> share of loans for the categorical columns, close to the shares in the loan_payments table
+LOAN_STATUS = {'Fully Paid': 0.4985, 'Current': 0.353, 'Charged Off': 0.1027,
+               'Does not meet the credit policy. Status:Fully Paid': 0.018,
+               'Does not meet the credit policy. Status:Charged Off': 0.0072, 'Late (31-120 days)': 0.0107,
+               'In Grace Period': 0.0049, 'Late (16-30 days)': 0.0019, 'Default': 0.0011}
+PURPOSE = {'debt_consolidation': 0.57, 'credit_card': 0.2, 'home_improvement': 0.06, 'other': 0.05, 'major_purchase': 0.025,
+           'small_business': 0.02, 'car': 0.015, 'medical': 0.01, 'moving': 0.008, 'wedding': 0.007, 'house': 0.006,
+           'vacation': 0.006, 'educational': 0.002, 'renewable_energy': 0.001}
+EMPLOYMENT_LENGTH = {'10+ years': 0.3, '2 years': 0.09, '< 1 year': 0.08, '3 years': 0.08, '5 years': 0.07, '1 year': 0.065,
+                     '4 years': 0.06, '6 years': 0.05, '7 years': 0.045, '8 years': 0.045, '9 years': 0.04, None: 0.04}
+GRADE = {'A': 0.2, 'B': 0.3, 'C': 0.2, 'D': 0.15, 'E': 0.1, 'F': 0.04, 'G': 0.01}
+HOME_OWNERSHIP = {'MORTGAGE': 0.5, 'RENT': 0.4, 'OWN': 0.08, 'OTHER': 0.015, 'NONE': 0.005}
+TERM = {'36 months': 0.72, '60 months': 0.19, None: 0.09}
+
+#typical interest rate (APR) of each grade
+GRADE_RATE = {'A': 7.0, 'B': 11.0, 'C': 14.0, 'D': 17.0, 'E': 20.0, 'F': 23.0, 'G': 25.0}
+
+
+def _choice(rng, shares, n_rows):
+    """
+    The function draws `n_rows` values with the given shares, None stays a null.
+    """
+    values = np.array(list(shares), dtype=object)
+    p = np.array(list(shares.values()))
+    return values[rng.choice(len(values), n_rows, p=p / p.sum())]
+
+
+def generate_loan_payments(n_rows, seed=0, start_id=1):
+    """
+    The function generates a synthetic table with the columns of the loan_payments table, so that
+    stages can be run and timed without the AWS RDS database. The categorical columns have the values
+    and about the shares of the real table, sub_grade follows grade, the interest rate depends on the
+    grade and the instalment is the annuity of the amount, rate and term.
+
+    :param n_rows: The number of rows (loans) to generate
+    :param seed: The seed for the random number generator, the same seed gives the same table
+    :param start_id: The first id, so tables generated in chunks have unique ids
+    :return: A pandas DataFrame shaped like the raw loan_payments extract
+    """
+    rng = np.random.default_rng(seed)
+    months = pd.date_range('2005-01-01', '2022-12-01', freq='MS').strftime('%b-%Y').to_numpy()
+
+    def month_column(null_share=0.0):
+        values = rng.choice(months, n_rows).astype(object)
+        values[rng.random(n_rows) < null_share] = None
+        return values
+
+    def amount_column(scale, null_share=0.0):
+        values = rng.gamma(2.0, scale, n_rows).round(2)
+        values[rng.random(n_rows) < null_share] = np.nan
+        return values
+
+    loan_amount = rng.integers(500, 35000, n_rows)
+    grade = _choice(rng, GRADE, n_rows)
+    term = _choice(rng, TERM, n_rows)
+    rate = (pd.Series(grade).map(GRADE_RATE).to_numpy(dtype='float64') + rng.normal(0, 1.5, n_rows)).clip(5, 26).round(2)
+    months_in_term = np.where(term == '60 months', 60, 36)
+    monthly_rate = rate / 1200
+    instalment = (loan_amount * monthly_rate / (1 - (1 + monthly_rate) ** -months_in_term)).round(2)
+    return pd.DataFrame({
+        'id': np.arange(start_id, start_id + n_rows),
+        'member_id': start_id + rng.permutation(n_rows),
+        'loan_amount': loan_amount,
+        'funded_amount': np.where(rng.random(n_rows) < 0.05, np.nan, loan_amount).astype('float64'),
+        'funded_amount_inv': loan_amount * rng.uniform(0.9, 1.0, n_rows),
+        'term': term,
+        'int_rate': np.where(rng.random(n_rows) < 0.1, np.nan, rate),
+        'instalment': instalment,
+        'grade': grade,
+        'sub_grade': grade + rng.integers(1, 6, n_rows).astype(str).astype(object),
+        'employment_length': _choice(rng, EMPLOYMENT_LENGTH, n_rows),
+        'home_ownership': _choice(rng, HOME_OWNERSHIP, n_rows),
+        'annual_inc': amount_column(35000),
+        'verification_status': rng.choice(['Verified', 'Source Verified', 'Not Verified'], n_rows),
+        'issue_date': month_column(),
+        'loan_status': _choice(rng, LOAN_STATUS, n_rows),
+        'payment_plan': rng.choice(['n', 'y'], n_rows, p=[0.99, 0.01]),
+        'purpose': _choice(rng, PURPOSE, n_rows),
+        'dti': rng.uniform(0, 40, n_rows).round(2),
+        'delinq_2yrs': rng.poisson(0.3, n_rows),
+        'earliest_credit_line': month_column(),
+        'inq_last_6mths': rng.poisson(1.0, n_rows),
+        'mths_since_last_delinq': np.where(rng.random(n_rows) < 0.57, np.nan, rng.integers(0, 150, n_rows)),
+        'mths_since_last_record': np.where(rng.random(n_rows) < 0.88, np.nan, rng.integers(0, 120, n_rows)),
+        'open_accounts': rng.poisson(10, n_rows),
+        'total_accounts': rng.poisson(24, n_rows),
+        'out_prncp': amount_column(1500),
+        'out_prncp_inv': amount_column(1500),
+        'total_payment': amount_column(6000),
+        'total_payment_inv': amount_column(6000),
+        'total_rec_prncp': amount_column(4500),
+        'total_rec_int': amount_column(1200),
+        'total_rec_late_fee': rng.exponential(0.5, n_rows).round(2),
+        'recoveries': rng.exponential(50, n_rows).round(2),
+        'collection_recovery_fee': rng.exponential(5, n_rows),
+        'last_payment_date': month_column(0.001),
+        'last_payment_amount': amount_column(1500),
+        'next_payment_date': month_column(0.6),
+        'last_credit_pull_date': month_column(0.0001),
+        'collections_12_mths_ex_med': np.where(rng.random(n_rows) < 0.001, np.nan, rng.poisson(0.01, n_rows)),
+        'mths_since_last_major_derog': np.where(rng.random(n_rows) < 0.86, np.nan, rng.integers(0, 150, n_rows)),
+        'policy_code': 1,
+        'application_type': 'INDIVIDUAL',
+    })
+
+
+def generate_loan_chunks(n_rows, chunksize=1000000, seed=0):
+    """
+    The function generates a synthetic loan_payments table of any size as a stream of chunks, so tables of
+    tens of millions of rows never have to be in memory. Chunk i is generated with the seed (seed, i), so
+    the same seed and chunksize always give the same table.
+
+    :return: A generator of pandas DataFrames with consecutive ids
+    """
+    for i, start in enumerate(range(0, n_rows, chunksize)):
+        yield generate_loan_payments(min(chunksize, n_rows - start), seed=[seed, i], start_id=start + 1)
+
+
+def write_loan_payments(path, n_rows, chunksize=1000000, seed=0):
+    """
+    The function writes a synthetic loan_payments table to a Parquet file one chunk at a time.
+
+    :return: The number of rows written
+    """
+    return save_chunks(generate_loan_chunks(n_rows, chunksize, seed), path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic loan_payments table")
+    parser.add_argument('path')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--chunksize', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(f"{write_loan_payments(args.path, args.rows, args.chunksize, args.seed)} rows written to {args.path}")
@@ -0,0 +1,279 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import hashlib
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from sketches import QuantileSketch
+from storage import file_fingerprint, iter_chunks, load_frame, open_snapshot, save_frame
+
+
+#correlation methods supported by the engine
+METHODS = ('pearson', 'spearman')
+
+#largest number of floats in the block multiplied at once, about 64 MB
+BLOCK_SIZE = 2 ** 23
+
+
+class CorrelationAccumulator:
+    """
+    The CorrelationAccumulator class collects the sufficient statistics of the Pearson correlation of
+    every pair of columns from a stream of chunks: for each pair the number of rows where both are
+    present, and the sums of x, x^2 and x*y over those rows. Each chunk is centred and scaled by the
+    mean and standard deviation of the first chunk, for accuracy, and all the sums of the chunk come from
+    one matrix product, so the work runs in BLAS. Accumulators built on different chunks or processes can
+    be merged, and the result is the same as `DataFrame.corr()` with pairwise removal of nulls.
+
+    Paramaters:
+    columns: List of the numeric columns to correlate
+
+    Atributes:
+    self.counts: p x p array, the number of rows where both columns are present
+    self.sums: p x p array, the sum of column i over the rows where column j is present
+    self.squares: p x p array, the sum of column i squared over the rows where column j is present
+    self.products: p x p array, the sum of column i times column j
+    self.shift, self.scale: The centring and scaling of each column, from the first chunk
+
+    Methods:
+    update(): Adds the rows of a chunk
+    merge(): Adds the statistics of another accumulator of the same columns
+    correlation(): Returns the correlation matrix
+    pair_counts(): Returns the number of rows used for each pair
+    """
+    def __init__(self, columns):
+        self.columns = list(columns)
+        p = len(self.columns)
+        self.counts = np.zeros((p, p))
+        self.sums = np.zeros((p, p))
+        self.squares = np.zeros((p, p))
+        self.products = np.zeros((p, p))
+        self.shift = None
+        self.scale = None
+
+    def update(self, chunk):
+        """
+        The function adds the rows of a chunk, a DataFrame holding the columns or a 2-D float array with
+        the columns in order. Nulls are left out of the pairs they belong to.
+        """
+        block = chunk[self.columns].to_numpy(dtype='float64', na_value=np.nan) if isinstance(chunk, pd.DataFrame) \
+            else np.asarray(chunk, dtype='float64')
+        if len(block) == 0:
+            return self
+        if self.shift is None:
+            with warnings.catch_warnings():
+                #columns that are all null in the first chunk are not shifted or scaled
+                warnings.simplefilter('ignore', RuntimeWarning)
+                self.shift = np.nan_to_num(np.nanmean(block, axis=0))
+                scale = np.nanstd(block, axis=0)
+            self.scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+        p = len(self.columns)
+        rows_per_block = max(1, BLOCK_SIZE // (3 * p))
+        for start in range(0, len(block), rows_per_block):
+            part = block[start:start + rows_per_block]
+            present = ~np.isnan(part)
+            standardised = np.where(present, (part - self.shift) / self.scale, 0.0)
+            #one product gives every sum: [X, M, X^2]^T [X, M] = [[X'X, X'M], [M'X, M'M], [(X^2)'X, (X^2)'M]]
+            left = np.hstack([standardised, present, standardised ** 2])
+            sums = left.T @ left[:, :2 * p]
+            self.products += sums[:p, :p]
+            self.sums += sums[:p, p:]
+            self.counts += sums[p:2 * p, p:]
+            self.squares += sums[2 * p:, p:]
+        return self
+
+    def merge(self, other):
+        """
+        The function adds the statistics of another accumulator of the same columns, first moving them to
+        this accumulator's centring and scaling.
+        """
+        if other.shift is None:
+            return self
+        if self.shift is None:
+            self.shift, self.scale = other.shift, other.scale
+        #x in this accumulator's units is a * x' + b, with x' in the other's units
+        a = other.scale / self.scale
+        b = (other.shift - self.shift) / self.scale
+        self.products += np.outer(a, a) * other.products + a[:, None] * b[None, :] * other.sums \
+            + b[:, None] * a[None, :] * other.sums.T + np.outer(b, b) * other.counts
+        self.squares += (a ** 2)[:, None] * other.squares + (2 * a * b)[:, None] * other.sums + (b ** 2)[:, None] * other.counts
+        self.sums += a[:, None] * other.sums + b[:, None] * other.counts
+        self.counts += other.counts
+        return self
+
+    def correlation(self, min_periods=2):
+        """
+        The function returns the Pearson correlation of every pair of columns over the rows where both
+        are present, NaN for pairs with fewer than `min_periods` rows or a constant column.
+
+        :return: A DataFrame with the columns as index and columns
+        """
+        n = self.counts
+        with np.errstate(invalid='ignore', divide='ignore'):
+            covariance = n * self.products - self.sums * self.sums.T
+            variance_x = n * self.squares - self.sums ** 2
+            correlation = covariance / np.sqrt(variance_x * variance_x.T)
+        correlation = np.clip(correlation, -1, 1)
+        correlation[(n < max(min_periods, 2)) | ~np.isfinite(correlation)] = np.nan
+        return pd.DataFrame(correlation, index=self.columns, columns=self.columns)
+
+    def pair_counts(self):
+        """
+        The function returns the number of rows where both columns of each pair are present.
+        """
+        return pd.DataFrame(self.counts.astype('int64'), index=self.columns, columns=self.columns)
+
+
+def correlate_chunks(chunks, columns, ranker=None):
+    """
+    The function accumulates the correlation statistics of a stream of chunks.
+
+    :param chunks: An iterable of pandas DataFrames holding the columns
+    :param columns: The numeric columns to correlate
+    :param ranker: Dictionary of column name -> QuantileSketch, to correlate the ranks of the values
+    (Spearman) instead of the values
+    :return: The CorrelationAccumulator
+    """
+    accumulator = CorrelationAccumulator(columns)
+    for chunk in chunks:
+        block = chunk[columns].to_numpy(dtype='float64', na_value=np.nan)
+        if ranker is not None:
+            block = np.column_stack([ranker[col].rank(block[:, i]) for i, col in enumerate(columns)])
+        accumulator.update(block)
+    return accumulator
+
+
+def sketch_chunks(chunks, columns, k=2000, seed=0):
+    """
+    The function builds a quantile sketch of each column, the first pass of the Spearman correlation.
+    Each sketch is seeded with (seed, column number), so sketches of partitions that will be merged
+    need different seeds, e.g. the partition number.
+    """
+    sketches = {col: QuantileSketch(k, seed=[seed, number]) for number, col in enumerate(columns)}
+    for chunk in chunks:
+        for col in columns:
+            values = chunk[col].to_numpy(dtype='float64', na_value=np.nan)
+            sketches[col].update(values[~np.isnan(values)])
+    return sketches
+
+
+def correlation_frame(df, columns=None, method='pearson', chunksize=100000):
+    """
+    The function computes the correlation matrix of an in-memory dataframe one chunk of rows at a time.
+    Spearman correlation is the Pearson correlation of the exact ranks of each column (ties get their
+    average rank); nulls are ranked out before pairing, so with nulls it can differ slightly from
+    `DataFrame.corr('spearman')`, which ranks each pair again.
+
+    :param df: The pandas DataFrame
+    :param columns: The numeric columns, by default every numeric column
+    :param method: 'pearson' or 'spearman'
+    :return: The correlation matrix as a DataFrame
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method}, expected one of {METHODS}")
+    columns = df.select_dtypes(include='number').columns.tolist() if columns is None else list(columns)
+    data = df[columns]
+    if method == 'spearman':
+        data = data.rank()
+    chunks = (data.iloc[start:start + chunksize] for start in range(0, len(data), chunksize))
+    return correlate_chunks(chunks, columns).correlation()
+
+
+def _partitions(path, workers):
+    """
+    The function splits a Parquet file by row groups, or an Arrow snapshot by rows, into `workers` ranges.
+    """
+    if path.endswith('.parquet'):
+        total = pq.ParquetFile(path).num_row_groups
+    else:
+        total = open_snapshot(path).num_rows
+    edges = np.unique(np.linspace(0, total, workers + 1).astype('int64'))
+    return edges[:-1], edges[1:]
+
+
+def _partition_chunks(path, start, stop, columns, chunksize=100000):
+    """
+    The function reads rows `start` to `stop` of a Parquet or Arrow file as chunks, for Parquet files
+    `start` and `stop` are row group numbers.
+    """
+    if path.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(path)
+        for row_group in range(start, stop):
+            yield parquet_file.read_row_group(row_group, columns=columns).to_pandas()
+    else:
+        table = open_snapshot(path, columns).slice(start, stop - start)
+        for batch in table.to_batches(max_chunksize=chunksize):
+            yield batch.to_pandas()
+
+
+def _correlate_partition(path, start, stop, columns, ranker):
+    return correlate_chunks(_partition_chunks(path, start, stop, columns), columns, ranker)
+
+
+def _sketch_partition(path, start, stop, columns, k, seed):
+    return sketch_chunks(_partition_chunks(path, start, stop, columns), columns, k, seed)
+
+
+def correlation_file(path, columns=None, method='pearson', workers=1, chunksize=100000, k=2000):
+    """
+    The function computes the correlation matrix of a Parquet file or Arrow snapshot without loading it
+    into memory. With several workers each process accumulates the statistics of a range of row groups
+    (Parquet) or rows (Arrow) and the accumulators are merged in partition order. Spearman correlation
+    takes two passes: quantile sketches of each column, then the Pearson correlation of the ranks read
+    from the sketches, whose rank error of about 2/k changes the correlation by at most a few times 1/k.
+
+    :param path: A .parquet file or .arrow snapshot (other formats are read with one worker)
+    :param columns: The numeric columns, by default every numeric column
+    :param method: 'pearson' or 'spearman'
+    :param workers: The number of processes
+    :param k: The size of the quantile sketches used for Spearman ranks
+    :return: The correlation matrix as a DataFrame
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method}, expected one of {METHODS}")
+    if columns is None:
+        columns = next(iter_chunks(path, 1000)).select_dtypes(include='number').columns.tolist()
+    columns = list(columns)
+    if workers <= 1 or not path.endswith(('.parquet', '.arrow', '.feather')):
+        ranker = sketch_chunks(iter_chunks(path, chunksize, columns), columns, k) if method == 'spearman' else None
+        return correlate_chunks(iter_chunks(path, chunksize, columns), columns, ranker).correlation()
+
+    starts, stops = _partitions(path, workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        ranker = None
+        if method == 'spearman':
+            ranker = sketch_chunks([], columns, k, seed=len(starts))
+            for sketches in executor.map(_sketch_partition, repeat(path), starts, stops, repeat(columns), repeat(k),
+                                         range(len(starts))):
+                for col, sketch in sketches.items():
+                    ranker[col].merge(sketch)
+        accumulator = CorrelationAccumulator(columns)
+        for partition in executor.map(_correlate_partition, repeat(path), starts, stops, repeat(columns), repeat(ranker)):
+            accumulator.merge(partition)
+    return accumulator.correlation()
+
+
+def cached_correlation(path, columns=None, method='pearson', workers=1, cache_dir='.correlation_cache', **kwargs):
+    """
+    The function returns the correlation matrix of a file from the cache, computing it with
+    `correlation_file` only the first time. The cache key is the file's path, size and modification time
+    with the columns and method, so a new snapshot at the same path is computed again.
+
+    :return: The correlation matrix as a DataFrame
+    """
+    key = hashlib.sha256(json.dumps([file_fingerprint(path), columns, method, kwargs], sort_keys=True).encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{key}.parquet")
+    if os.path.exists(cache_path):
+        matrix = load_frame(cache_path)
+        matrix.index = matrix.columns
+        return matrix
+    matrix = correlation_file(path, columns, method, workers, **kwargs)
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary_path = f"{cache_path}.tmp.parquet"
+    save_frame(matrix.reset_index(drop=True), temporary_path)
+    os.replace(temporary_path, cache_path)
+    return matrix
@@ -1,20 +1,36 @@
-from sqlalchemy import create_engine
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import datetime
+import os
+import warnings
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import URL
 import pandas as pd 
+import numpy as np
 import yaml
 
+from EDA import DataTransform, loan_payments_schema, parse_months
+from instrumentation import enable_from_environment, instrument
+from pushdown import chunk_schema, finish_conversions, pushdown_select, reflect_table, sortable_column, summary_frame, summary_select, value_counts_select
+from storage import load_frame, save_chunks, save_frame, stage_path
 
 
-def load_database_credentials(): 
+
+def load_database_credentials(path=None): 
     """
     The function `load_database_credentials` reads and returns the contents of a YAML file containing
     AWS RDS database credentials.
+    
+    :param path: The YAML file, by default the LOAN_PAYMENTS_CREDENTIALS environment variable or
+    credentials.yaml next to this file
     :return: The function `load_database_credentials` is returning the `database_credentials` variable.
     """
-    with open ('/Users/jawadelamri/exploratory-data-analysis---customer-loans-in-finance622/credentials.yaml', 'r') as r:
+    path = path or os.environ.get('LOAN_PAYMENTS_CREDENTIALS') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'credentials.yaml')
+    with open (path, 'r') as r:
         database_credentials  = yaml.safe_load(r)
         return database_credentials 
 
 
+@instrument
 class RDSDatabaseConnector: 
     """ 
     The RDSDatabaseConnector class connects to the AWS RDS database, extracts the loan payments table, and saves the data to a CSV file.
@@ -26,13 +42,23 @@ class RDSDatabaseConnector:
     
     Atributes: 
     self.database_credentials_dict: The database credentials
+    self.engine: The SQLAlchemy engine, created once and reused by every extraction
     
 
     Methods:
     __init__(): Initialises the class
     initialise_sqlalchmey_engine(): Connects to the AWS database
     database_extraction(): Extracts the dataframe from the cloud
+    stream_extraction(): Extracts the dataframe from the cloud in chunks using a server-side cursor
+    partitioned_extraction(): Extracts the dataframe in range partitions read in parallel from the connection pool
     save_data_to_csv(): Saves the dataframe on local hard drive 
+    save_data(): Saves the dataframe on local hard drive in a columnar format (Parquet by default)
+    save_chunks_to_csv(): Saves the streamed chunks on local hard drive one at a time
+    save_chunks_to_parquet(): Saves the streamed chunks to one Parquet file, one row group per chunk
+    incremental_sync(): Fetches only new or updated rows and upserts them into the local snapshot
+    pushdown_extraction(): Extracts only the needed columns with the type conversions done by the database
+    pushdown_summary(): Computes the counts, nulls, distinct values and min/max/mean/std of columns in the database
+    pushdown_value_counts(): Counts the rows of each value of a column in the database
 
      
     """
@@ -44,17 +70,34 @@ class RDSDatabaseConnector:
         database. The dictionary should have the following keys:
         """
         self.database_credentials_dict = database_credentials_dict
+        self.engine = None
     
-    def initialise_sqlalchmey_engine(self):
+    def initialise_sqlalchmey_engine(self, pool_size=5):
         """
         The function `initialise_sqlalchemy_engine` initialises and returns a SQLAlchemy engine using
-        the yaml credentials
+        the yaml credentials. The engine is created once and cached, so repeated calls share one bounded
+        connection pool instead of opening new connections each time.
+        
+        :param pool_size: The maximum number of connections held by the pool
+        """
+        if self.engine is None:
+            self.engine = self._create_engine(pool_size)
+        return self.engine 
+
+    def _create_engine(self, pool_size):
         """
-        login = database_credentials_dict
-        engine = create_engine(f"{login['DATABASE_TYPE']}+{login['DBAPI']}://{login['USER']} :{login['PASSWORD']}@{login['HOST']}\:{login['PORT']}/{login['DATABASE']}")
-        engine.execution_options(isolation_level='AUTOCOMMIT').connect()
-        engine.connect() 
-        return engine 
+        The function creates a SQLAlchemy engine from the credentials with a pool of `pool_size` connections.
+        """
+        login = self.database_credentials_dict
+        url = URL.create(
+            f"{login['DATABASE_TYPE']}+{login['DBAPI']}",
+            username=login.get('USER'),
+            password=login.get('PASSWORD'),
+            host=login.get('HOST'),
+            port=login.get('PORT'),
+            database=login.get('DATABASE'),
+        )
+        return create_engine(url, pool_size=pool_size, max_overflow=0, pool_pre_ping=True)
    
     def database_extraction(self, table):
         """
@@ -70,23 +113,332 @@ class RDSDatabaseConnector:
         query = f"SELECT * FROM {table}"
         df = pd.read_sql(query, connect_to_database)
         return df
+
+    def stream_extraction(self, table, chunksize=50000, apply_dtypes=True, categories=None):
+        """
+        The function `stream_extraction` extracts the table in chunks using a server-side cursor, so only
+        one chunk is held in memory at a time instead of the whole table.
+        
+        :param table: The name of the table in the database
+        :param chunksize: The number of rows fetched from the cursor for each chunk
+        :param apply_dtypes: If True each chunk is given the target data types from `DataTransform`
+        as soon as it arrives. The types are the same for every chunk (see `pushdown.chunk_schema`), so
+        'int64' columns of the schema are the nullable Int64 and category columns have all the categories
+        of the table
+        :param categories: Dictionary of category column -> its known values, so the table isn't read for
+        them before streaming
+        :return: A generator of pandas DataFrame chunks
+        """
+        engine = self.initialise_sqlalchmey_engine()
+        dtypes = chunk_schema(engine, table, categories=categories) if apply_dtypes else None
+        query = text(f"SELECT * FROM {table}")
+        #stream_results asks the DBAPI for a server-side cursor instead of buffering the full result
+        with engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as connection:
+            for chunk in pd.read_sql(query, connection, chunksize=chunksize):
+                if apply_dtypes:
+                    transform = DataTransform(chunk)
+                    transform.apply_schema(dtypes)
+                    chunk = transform.df
+                yield chunk
+
+    def partitioned_extraction(self, table, partition_column='id', partitions=8, workers=4, use_processes=False):
+        """
+        The function `partitioned_extraction` splits the table into ranges of `partition_column` and reads
+        the ranges at the same time. The partitions are merged in range order and rows are ordered by
+        `partition_column`, so the result does not depend on which worker finishes first.
+        
+        :param table: The name of the table in the database
+        :param partition_column: A numeric, date or month column to split on, e.g. the primary key `id` or
+        `issue_date`. Month text columns are split on their month number, see `pushdown.sortable_column`
+        :param partitions: The number of ranges to split the table into
+        :param workers: The number of workers, and pooled connections, reading at the same time
+        :param use_processes: If False the workers are threads sharing a connection pool. If True
+        they are processes with one connection each, for drivers that hold the GIL while decoding rows
+        :return: The pandas DataFrame of the full table
+        """
+        engine = self.initialise_sqlalchmey_engine(pool_size=workers)
+        expression = sortable_column(reflect_table(engine, table), partition_column)[0]
+        #the partition expression is written into each query, so it can be sent to worker processes as text
+        column = str(expression.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+        with engine.connect() as connection:
+            low, high, rows = connection.execute(text(f"SELECT MIN({column}), MAX({column}), COUNT(*) FROM {table}")).one()
+
+        ranges = partition_ranges(low, high, partitions)
+        queries = [(f"SELECT * FROM {table} WHERE {column} >= :low AND {column} < :high ORDER BY {column}",
+                    {'low': start, 'high': end}) for start, end in ranges[:-1]]
+        #last range has no upper bound, so it keeps the maximum even where the database stores dates as text
+        #with more digits than the bound value, e.g. SQLite
+        queries.append((f"SELECT * FROM {table} WHERE {column} >= :low ORDER BY {column}", {'low': ranges[-1][0]}))
+        #rows where the partition value is null (or a month can't be read) belong to no range
+        queries.append((f"SELECT * FROM {table} WHERE {column} IS NULL", {}))
+
+        partition_engine = None
+        if use_processes:
+            #an engine cannot be shared across processes, so each worker builds its own from the credentials
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_initialise_partition_worker,
+                                           initargs=(self.database_credentials_dict,))
+            engines = [None] * len(queries)
+        else:
+            #the cached engine may have been created with a smaller pool, then the extra workers would wait
+            if engine.pool.size() < workers:
+                engine = partition_engine = self._create_engine(workers)
+            executor = ThreadPoolExecutor(max_workers=workers)
+            engines = [engine] * len(queries)
+        try:
+            with executor:
+                frames = list(executor.map(_read_partition, queries, engines))
+        finally:
+            if partition_engine is not None:
+                partition_engine.dispose()
+        read = sum(len(frame) for frame in frames)
+        if read != rows:
+            warnings.warn(f"the partitions of {table} have {read} rows but the table had {rows}, it may have changed during the extraction")
+        #empty partitions come back with object columns, which would upcast the merged frame
+        frames = [frame for frame in frames if len(frame)] or frames[:1]
+        return pd.concat(frames, ignore_index=True)
    
     def save_data_to_csv(self, df):
         """
         The function saves a DataFrame to a CSV file without including the index.
         """
         df.to_csv('loan_payments.csv', index=False)
-       
+
+    def save_data(self, df, path=stage_path('loan_payments')):
+        """
+        The function saves a DataFrame in the format given by the file suffix, Parquet by default, so
+        the next stage can read it without parsing text.
+        """
+        save_frame(df, path)
+
+    def save_chunks_to_csv(self, chunks, path='loan_payments.csv'):
+        """
+        The function appends each chunk from `stream_extraction` to a CSV file, writing the header
+        only once, so the full table never has to be in memory.
+        
+        :param chunks: An iterable of pandas DataFrame chunks
+        :param path: The CSV file to write to
+        :return: The total number of rows written
+        """
+        rows = 0
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(path, index=False, mode='w' if i == 0 else 'a', header=(i == 0))
+            rows += len(chunk)
+        return rows
+
+    def save_chunks_to_parquet(self, chunks, path=stage_path('loan_payments')):
+        """
+        The function writes each chunk from `stream_extraction` as a row group of one Parquet file,
+        keeping the data types given to the chunks.
+        
+        :return: The total number of rows written
+        """
+        return save_chunks(chunks, path)
+
+    def incremental_sync(self, table, snapshot_path=stage_path('loan_payments'), state_path='sync_state.yaml',
+                         watermark_column='last_payment_date', key_column='id'):
+        """
+        The function `incremental_sync` updates the local snapshot with only the rows that are new or
+        changed since the last sync, instead of downloading the whole table again.
+        
+        The state file keeps a high-water mark: the largest `watermark_column` value and the largest
+        `key_column` seen so far. Rows at or after the watermark are fetched again (so rows updated within
+        the same period are not missed), rows with a larger key are new loans, and both are upserted
+        into the snapshot by `key_column`. The first run, or a run without a snapshot, does a full extraction.
+        
+        :param table: The name of the table in the database
+        :param snapshot_path: The local snapshot of the table, in any format supported by `save_frame`
+        :param state_path: The YAML file holding the high-water mark between runs
+        :param watermark_column: A column that increases when a row changes, e.g. `last_payment_date` or
+        `last_credit_pull_date`. Numbers, dates and the month text columns of `loan_payments_schema`
+        are supported, month text is compared and stored as its month number (see
+        `pushdown.sortable_column`), other text columns raise a ValueError
+        :param key_column: The primary key of the table
+        :return: The number of rows fetched from the database
+        """
+        engine = self.initialise_sqlalchmey_engine()
+        expression, kind = sortable_column(reflect_table(engine, table), watermark_column)
+        state = load_sync_state(state_path)
+        #state files written before month watermarks were stored as month numbers hold the text
+        if state is not None and kind == 'month' and isinstance(state['watermark'], str):
+            state['watermark'] = _month_number(pd.Series([state['watermark']]), watermark_column).iloc[0].item()
+        if state is None or not os.path.exists(snapshot_path):
+            delta = self.database_extraction(table)
+            snapshot = delta
+        else:
+            column = str(expression.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+            query = text(f"SELECT * FROM {table} WHERE {column} >= :watermark OR {key_column} > :last_key")
+            with engine.connect() as connection:
+                delta = pd.read_sql(query, connection, params={'watermark': state['watermark'], 'last_key': state['last_key']})
+            snapshot = load_frame(snapshot_path)
+            snapshot = snapshot[~snapshot[key_column].isin(delta[key_column])]
+            snapshot = pd.concat([snapshot, delta], ignore_index=True).sort_values(key_column, ignore_index=True)
+
+        save_frame(snapshot, snapshot_path)
+        if len(delta) or state is None:
+            previous = state or {'watermark': None, 'last_key': None}
+            watermarks = _month_number(delta[watermark_column], watermark_column) if kind == 'month' else delta[watermark_column]
+            save_sync_state(state_path, {
+                'watermark': _max_value(watermarks, previous['watermark']),
+                'watermark_kind': kind,
+                'last_key': _max_value(delta[key_column], previous['last_key']),
+                'rows_fetched': len(delta),
+                'synced_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            })
+        return len(delta)
+
+    def pushdown_extraction(self, table, columns=None, parse_term=True):
+        """
+        The function `pushdown_extraction` extracts only `columns` and has the database do the conversions
+        of `DataTransform` that SQL can do (rounding, integer casts, month strings to month numbers,
+        booleans and the "months" of the term), so fewer bytes are sent and fewer rows are parsed by
+        pandas. The result has the same data types as `transform_loan_payments` on `database_extraction`,
+        except the term is a number of months when `parse_term` is True.
+        
+        :param table: The name of the table in the database
+        :param columns: The columns to extract, by default all of them
+        :return: The pandas DataFrame
+        """
+        engine = self.initialise_sqlalchmey_engine()
+        query, remaining = pushdown_select(reflect_table(engine, table), columns, parse_term=parse_term)
+        with engine.connect() as connection:
+            df = pd.read_sql(query, connection)
+        return finish_conversions(df, remaining)
+
+    def pushdown_summary(self, table, columns=None):
+        """
+        The function `pushdown_summary` computes the count, nulls, distinct values, min, max, mean and
+        standard deviation of each column in the database with one query, so only one row is sent back
+        instead of the table.
+        
+        :return: A DataFrame with one row of statistics per column
+        """
+        engine = self.initialise_sqlalchmey_engine()
+        source = reflect_table(engine, table)
+        columns = [column.name for column in source.columns] if columns is None else list(columns)
+        with engine.connect() as connection:
+            row = connection.execute(summary_select(source, columns)).one()
+        return summary_frame(row, columns)
+
+    def pushdown_value_counts(self, table, column):
+        """
+        The function `pushdown_value_counts` counts the rows of each value of a column in the database,
+        e.g. the distinct values of a category column, most frequent first.
+        
+        :return: A pandas Series of value -> count
+        """
+        engine = self.initialise_sqlalchmey_engine()
+        with engine.connect() as connection:
+            counts = pd.read_sql(value_counts_select(reflect_table(engine, table), column), connection)
+        return counts.set_index(column)['count']
+
+
+
+def load_sync_state(state_path):
+    """
+    The function reads the high-water mark written by `incremental_sync`.
+    
+    :param state_path: The YAML state file
+    :return: The state dictionary, or None if there has been no sync yet
+    """
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, 'r') as r:
+        return yaml.safe_load(r)
+
+
+def save_sync_state(state_path, state):
+    """
+    The function writes the high-water mark for the next `incremental_sync`. The file is replaced in one
+    step so an interrupted run cannot leave a half written state behind.
+    """
+    temporary_path = f"{state_path}.tmp"
+    with open(temporary_path, 'w') as w:
+        yaml.safe_dump(state, w)
+    os.replace(temporary_path, state_path)
+
+
+def _month_number(column, watermark_column):
+    """
+    The function returns the month numbers of a month text column, the values `pushdown.month_ordinal`
+    computes in the database.
+    """
+    return parse_months(column, loan_payments_schema[watermark_column].get('format', '%b-%Y'), output='ordinal')
+
+
+def _max_value(column, previous):
+    """
+    The function returns the largest non-null value of `column` and `previous` as a plain Python value
+    that can be written to YAML and bound as a query parameter.
+    """
+    value = column.max()
+    if pd.isnull(value):
+        return previous
+    if isinstance(value, pd.Timestamp):
+        value = value.to_pydatetime()
+    elif isinstance(value, np.generic):
+        value = value.item()
+    if previous is not None and previous > value:
+        return previous
+    return value
+
+
+_worker_engine = None
+
+
+def _initialise_partition_worker(database_credentials_dict):
+    """
+    The function creates the engine used by a `partitioned_extraction` worker process.
+    """
+    global _worker_engine
+    _worker_engine = RDSDatabaseConnector(database_credentials_dict).initialise_sqlalchmey_engine(pool_size=1)
+
+
+def _read_partition(query_and_params, engine=None):
+    """
+    The function reads one partition of the table on a connection from `engine`, or from the worker
+    process's own engine.
+    """
+    query, params = query_and_params
+    with (engine or _worker_engine).connect() as connection:
+        return pd.read_sql(text(query), connection, params=params)
+
+
+def partition_ranges(low, high, partitions):
+    """
+    The function splits the range between `low` and `high` into equal-width (start, end) pairs.
+    
+    :param low: The minimum value of the partition column, a number or a date
+    :param high: The maximum value of the partition column
+    :param partitions: The number of ranges to return
+    :return: A list of (start, end) tuples covering `low` to `high`
+    """
+    if low is None:
+        return [(None, None)]
+    if isinstance(low, (int, np.integer)):
+        edges = np.unique(np.linspace(low, high, partitions + 1).round().astype('int64')).tolist()
+    elif isinstance(low, (float, np.floating)):
+        edges = np.unique(np.linspace(low, high, partitions + 1)).tolist()
+    else:
+        edges = pd.date_range(pd.Timestamp(low), pd.Timestamp(high), periods=partitions + 1)
+        if isinstance(low, datetime.datetime):
+            edges = sorted({edge.to_pydatetime() for edge in edges})
+        else:
+            edges = sorted({edge.date() for edge in edges})
+    if len(edges) == 1:
+        return [(low, high)]
+    return list(zip(edges[:-1], edges[1:]))
+
         
 if __name__ == "__main__":
 #code won't run unless file is executed as a script 
+    enable_from_environment()
     database_credentials_dict = load_database_credentials()
     database_connection = RDSDatabaseConnector(database_credentials_dict)
     loan_payments_df = database_connection.database_extraction('loan_payments')
-    database_connection.save_data_to_csv(df='loan_payments')
+    database_connection.save_data(loan_payments_df)
    
-loan_payments_df.info()
-loan_payments_df.describe()
+    loan_payments_df.info()
+    loan_payments_df.describe()
 
 
     
@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from sketches import FrequencyCounter, QuantileSketch
+
+
+class NullImputer:
+    """
+    The NullImputer class fills null values with the median or mode of each column. The fill values are
+    found once (`fit`) and can be saved, so later batches are filled (`transform`) without fitting again.
+    Unlike sklearn's SimpleImputer it works column by column, so categories, dates and integers keep
+    their data types, and it can be fitted on a stream of chunks.
+
+    Paramaters:
+    median_impute: List of columns to be imputed with the median
+    mode_impute: List of columns to be imputed with the mode
+    k: The size of the quantile sketches used for the medians when fitting on chunks
+
+    Atributes:
+    self.fill_values: Dictionary of column name -> value used to fill its nulls
+
+    Methods:
+    __init__(): Initialises the class
+    fit(): Finds the medians and modes in one pass over a stream of chunks
+    fit_frame(): Finds the exact medians and modes of an in-memory dataframe
+    transform(): Fills the nulls of a dataframe in place
+    save(): Saves the fill values to a YAML file
+    load(): Loads fill values saved by `save`
+    """
+    def __init__(self, median_impute=(), mode_impute=(), k=1000):
+        """
+        The function initialises the class with the columns to impute.
+        """
+        self.median_impute = list(median_impute)
+        self.mode_impute = list(mode_impute)
+        self.k = k
+        self.fill_values = {}
+
+    def fit(self, chunks):
+        """
+        The function finds the fill values in a single pass over a stream of chunks: medians from quantile
+        sketches (rank error about 2/k, see `sketches.QuantileSketch`) and modes from frequency counts.
+
+        :param chunks: An iterable of pandas DataFrames holding the columns to impute
+        :return: The fitted NullImputer
+        """
+        sketches = {col: QuantileSketch(self.k) for col in self.median_impute}
+        counters = {col: FrequencyCounter() for col in self.mode_impute}
+        dtypes = {}
+        for chunk in chunks:
+            for col, sketch in sketches.items():
+                values = chunk[col].dropna()
+                dtypes.setdefault(col, values.dtype)
+                if pd.api.types.is_datetime64_any_dtype(values.dtype):
+                    values = values.to_numpy(dtype='datetime64[ns]').astype('int64')
+                sketch.update(values.to_numpy(dtype='float64'))
+            for col, counter in counters.items():
+                counter.update(chunk[col])
+
+        for col, sketch in sketches.items():
+            self.fill_values[col] = _as_dtype(sketch.quantile(0.5)[0], dtypes.get(col))
+        for col, counter in counters.items():
+            self.fill_values[col] = _most_frequent(counter.top(len(counter.counts)))
+        return self
+
+    def fit_frame(self, df):
+        """
+        The function finds the exact medians and modes of an in-memory dataframe, the same values as
+        SimpleImputer's "median" and "most_frequent" strategies.
+
+        :return: The fitted NullImputer
+        """
+        for col in self.median_impute:
+            self.fill_values[col] = _as_dtype(df[col].median(), df[col].dtype)
+        for col in self.mode_impute:
+            self.fill_values[col] = _most_frequent(df[col].value_counts(dropna=True))
+        return self
+
+    def transform(self, df):
+        """
+        The function fills the nulls of each fitted column of `df` in place, keeping the column's data type.
+        A fill value that is not yet a category of a category column is added to its categories.
+
+        :return: The same DataFrame
+        """
+        for col, value in self.fill_values.items():
+            if col not in df.columns or value is None or not df[col].hasnans:
+                continue
+            if isinstance(df[col].dtype, pd.CategoricalDtype) and value not in df[col].cat.categories:
+                df[col] = df[col].cat.add_categories([value])
+            df[col] = df[col].fillna(value)
+        return df
+
+    def save(self, path):
+        """
+        The function saves the fill values to a YAML file, dates are stored as ISO strings.
+        """
+        values = {}
+        for col, value in self.fill_values.items():
+            if isinstance(value, pd.Timestamp):
+                values[col] = {'value': value.isoformat(), 'type': 'datetime'}
+            else:
+                values[col] = {'value': value.item() if isinstance(value, np.generic) else value, 'type': 'value'}
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w') as w:
+            yaml.safe_dump({'median_impute': self.median_impute, 'mode_impute': self.mode_impute, 'fill_values': values}, w)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        The function creates a fitted NullImputer from a file written by `save`.
+        """
+        with open(path, 'r') as r:
+            saved = yaml.safe_load(r)
+        imputer = cls(saved['median_impute'], saved['mode_impute'])
+        for col, entry in saved['fill_values'].items():
+            imputer.fill_values[col] = pd.Timestamp(entry['value']) if entry['type'] == 'datetime' else entry['value']
+        return imputer
+
+
+def _most_frequent(counts):
+    """
+    The function returns the most frequent value from a Series of counts, the smallest one if several
+    values are tied (as SimpleImputer does), or None if there are no values.
+    """
+    if len(counts) == 0:
+        return None
+    tied = counts[counts == counts.max()].index.tolist()
+    try:
+        return min(tied)
+    except TypeError:
+        return tied[0]
+
+
+def _as_dtype(value, dtype):
+    """
+    The function converts a median back to the data type of its column: a Timestamp for dates and the
+    nearest whole number for integers.
+    """
+    if dtype is None or pd.isnull(value):
+        return None
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return pd.Timestamp(int(value), unit='ns') if not isinstance(value, pd.Timestamp) else value
+    if pd.api.types.is_integer_dtype(dtype):
+        return int(round(value))
+    return float(value)
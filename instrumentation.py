@@ -0,0 +1,302 @@
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+
+#set to a file path to trace every run of the scripts to that file, e.g. LOAN_PAYMENTS_TRACE=trace.jsonl
+TRACE_ENVIRONMENT = 'LOAN_PAYMENTS_TRACE'
+
+
+class Tracer:
+    """
+    The Tracer class records one event for every call of an instrumented method (see `instrument`) while
+    it is enabled. An event is a dictionary with the class and method, the wall and CPU seconds, the
+    input and output rows and columns and frame memory, the change of the resident memory of the process
+    and its peak so far, and, when memory tracing is on, the peak and change of the memory allocated by
+    Python (tracemalloc). Methods returning a generator are recorded when the generator is created.
+    Nested calls, e.g. a method calling another instrumented method, record their depth and the id of
+    the call they are part of. Events are written as JSON lines to a trace file and/or kept in memory.
+
+    While the tracer is disabled an instrumented method only checks `enabled` before running, so the
+    instrumentation can stay in place. Only the process that enabled the tracer records events, so the
+    worker processes it forks don't write to its trace file.
+
+    Paramaters:
+    path: The trace file events are appended to, None to only keep them in memory
+    memory: If True track memory with tracemalloc, which slows allocations down while it runs
+    deep: If True measure the memory of object columns by their values (`memory_usage(deep=True)`),
+    which reads every value of those columns before and after each call
+
+    Atributes:
+    self.enabled: True while events are recorded
+    self.events: List of the events recorded since `enable`
+    self.pid: The id of the process that enabled the tracer
+
+    Methods:
+    enable(): Starts recording events
+    disable(): Stops recording events and closes the trace file
+    record(): Runs a function and records its event
+    """
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.path = None
+        self.memory = True
+        self.deep = False
+        self._file = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._next_id = 0
+        self._started_tracemalloc = False
+        self.pid = None
+
+    def enable(self, path=None, memory=True, deep=False):
+        """
+        The function starts recording the calls of instrumented methods.
+
+        :return: The same Tracer
+        """
+        self.disable()
+        self.events = []
+        self.path, self.memory, self.deep = path, memory, deep
+        if path:
+            self._file = open(path, 'a')
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        else:
+            self._started_tracemalloc = False
+        self.pid = os.getpid()
+        self.enabled = True
+        return self
+
+    def disable(self):
+        """
+        The function stops recording events, closes the trace file and stops tracemalloc if `enable`
+        started it.
+        """
+        if not self.enabled:
+            return
+        self.enabled = False
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+    def _stack(self):
+        """
+        The function returns the stack of calls being recorded in this thread.
+        """
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _frame_shape(self, value):
+        """
+        The function returns the rows, columns and memory in bytes of a DataFrame or Series, or Nones.
+        """
+        if isinstance(value, pd.DataFrame):
+            return len(value), value.shape[1], int(value.memory_usage(index=True, deep=self.deep).sum())
+        if isinstance(value, pd.Series):
+            return len(value), 1, int(value.memory_usage(index=True, deep=self.deep))
+        return None, None, None
+
+    def record(self, name, function, frame=None, output=None):
+        """
+        The function runs `function()` and records its event. The input frame is `frame()` before the call
+        and the output frame is `output()` after it, or the returned value if that is None and the call
+        returned a DataFrame or Series.
+        Calls that raise are recorded with the error and raise it again.
+
+        :param name: The name of the event, e.g. 'DataTransform.object_to_date'
+        :param frame: Function returning the input frame, or None
+        :param output: Function returning the output frame, or None
+        :return: The value returned by `function`
+        """
+        stack = self._stack()
+        with self._lock:
+            self._next_id += 1
+            event = {'id': self._next_id, 'name': name, 'parent': stack[-1]['id'] if stack else None, 'depth': len(stack),
+                     'pid': os.getpid(), 'thread': threading.get_ident(), 'timestamp': time.time()}
+        event['rows_in'], event['cols_in'], event['frame_bytes_in'] = self._frame_shape(frame() if frame else None)
+
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            #a nested call resets the peak, so the peak so far is kept for the call it is part of
+            if stack:
+                stack[-1]['_peak'] = max(stack[-1]['_peak'], peak)
+            tracemalloc.reset_peak()
+            event['_start'], event['_peak'] = current, 0
+        rss_before = current_rss()
+        stack.append(event)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            value = function()
+        except BaseException as error:
+            event['error'] = f"{type(error).__name__}: {error}"
+            raise
+        finally:
+            event['wall_seconds'] = time.perf_counter() - wall
+            event['cpu_seconds'] = time.process_time() - cpu
+            stack.pop()
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(event.pop('_peak'), peak)
+                start = event.pop('_start')
+                event['traced_peak_bytes'] = peak - start
+                event['traced_delta_bytes'] = current - start
+                if stack:
+                    stack[-1]['_peak'] = max(stack[-1]['_peak'], peak)
+            rss_after = current_rss()
+            event['rss_delta_bytes'] = rss_after - rss_before if rss_after is not None and rss_before is not None else None
+            event['max_rss_bytes'] = max_rss()
+            if 'error' in event:
+                self._emit(event)
+        returned = output() if output else None
+        if returned is None and isinstance(value, (pd.DataFrame, pd.Series)):
+            returned = value
+        event['rows_out'], event['cols_out'], event['frame_bytes_out'] = self._frame_shape(returned)
+        self._emit(event)
+        return value
+
+    def _emit(self, event):
+        """
+        The function keeps an event and writes it to the trace file.
+        """
+        with self._lock:
+            self.events.append(event)
+            if self._file is not None:
+                self._file.write(json.dumps(event, default=str) + '\n')
+                self._file.flush()
+
+
+tracer = Tracer()
+
+
+def current_rss():
+    """
+    The function returns the resident memory of the process in bytes, or None where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as r:
+            return int(r.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss():
+    """
+    The function returns the peak resident memory of the process in bytes, or None where the resource
+    module is not available (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    #ru_maxrss is in KB on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _instance_frame(instance):
+    """
+    The function returns the dataframe an instance works on without loading a lazy one: `_df` for
+    `LazyFrame` classes and `df` for `DataTransform`.
+    """
+    attributes = vars(instance)
+    return attributes.get('_df', attributes.get('df'))
+
+
+def instrument(cls):
+    """
+    The class decorator wraps every public method of a class so that its calls are recorded by `tracer`
+    while it is enabled. The input and output frames are the instance's dataframe before and after the
+    call, so e.g. the rows removed by `remove_outliers` are rows_in - rows_out. For classes without a
+    dataframe, such as `RDSDatabaseConnector`, the output frame is the DataFrame returned.
+
+    :return: The same class
+    """
+    for name, method in list(vars(cls).items()):
+        if name.startswith('_') or not callable(method) or isinstance(method, (staticmethod, classmethod, type)):
+            continue
+        setattr(cls, name, _traced_method(method, f"{cls.__name__}.{name}"))
+    return cls
+
+
+def _traced_method(method, name):
+    """
+    The function returns `method` wrapped to be recorded by `tracer`.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not tracer.enabled or os.getpid() != tracer.pid:
+            return method(self, *args, **kwargs)
+        return tracer.record(name, lambda: method(self, *args, **kwargs),
+                             frame=lambda: _instance_frame(self), output=lambda: _instance_frame(self))
+    return wrapper
+
+
+def enable_from_environment():
+    """
+    The function enables the tracer if the LOAN_PAYMENTS_TRACE environment variable gives a trace file.
+    It is called by the scripts when they are run, not when the modules are imported.
+    """
+    path = os.environ.get(TRACE_ENVIRONMENT)
+    if path and not tracer.enabled:
+        tracer.enable(path)
+
+
+@contextlib.contextmanager
+def tracing(path=None, memory=True, deep=False):
+    """
+    The function is a context manager recording the calls of instrumented methods in its block, e.g.
+    `with tracing('trace.jsonl') as events: ...`, see `Tracer.enable` for the arguments.
+
+    :return: The list the events are added to
+    """
+    tracer.enable(path, memory, deep)
+    try:
+        yield tracer.events
+    finally:
+        tracer.disable()
+
+
+def read_trace(path):
+    """
+    The function reads the events of a trace file.
+
+    :return: A DataFrame with one row per event
+    """
+    with open(path, 'r') as r:
+        return pd.DataFrame([json.loads(line) for line in r if line.strip()])
+
+
+def trace_summary(events):
+    """
+    The function sums the events of each method: the number of calls, the total wall and CPU seconds, the
+    largest traced peak and the rows in and out.
+
+    :param events: A list of events or the DataFrame of `read_trace`
+    :return: A DataFrame with one row per method, slowest first
+    """
+    events = pd.DataFrame(events)
+    for col in ['traced_peak_bytes', 'rows_in', 'rows_out']:
+        if col not in events:
+            events[col] = float('nan')
+    summary = events.groupby('name').agg(calls=('name', 'size'), wall_seconds=('wall_seconds', 'sum'),
+                                         cpu_seconds=('cpu_seconds', 'sum'), traced_peak_mb=('traced_peak_bytes', 'max'),
+                                         rows_in=('rows_in', 'sum'), rows_out=('rows_out', 'sum'))
+    summary['traced_peak_mb'] = summary['traced_peak_mb'] / 1024 ** 2
+    return summary.sort_values('wall_seconds', ascending=False)
+
+
+if __name__ == '__main__':
+    print(trace_summary(read_trace(sys.argv[1] if len(sys.argv) > 1 else 'trace.jsonl')).to_string())
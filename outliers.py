@@ -0,0 +1,143 @@
+import numpy as np
+
+from sketches import QuantileSketch
+
+
+class OutlierFilter:
+    """
+    The OutlierFilter class removes rows with outliers in two passes: `fit` finds lower and upper fences
+    for each column, then `mask`/`filter` flag the rows outside the fences of any column with one
+    vectorised comparison over the column block. Both passes can run over a stream of chunks, so only one
+    chunk and one quantile sketch per column are held in memory.
+
+    Each column has a fence policy, the default being {'method': 'iqr', 'threshold': 1.5}:
+    - {'method': 'iqr', 'threshold': t}: outside Q1 - t * IQR and Q3 + t * IQR
+    - {'method': 'quantile', 'lower': q1, 'upper': q2}: outside the q1 and q2 quantiles
+    - {'method': 'fixed', 'lower': a, 'upper': b}: outside the values a and b (None for no fence)
+    - {'method': 'none'}: never an outlier
+    Any policy can add 'side': 'lower' or 'upper' to only use one fence.
+
+    Paramaters:
+    columns: List of numeric columns to check
+    threshold: The IQR multiplier for columns without a policy
+    policies: Dictionary of column name -> fence policy
+    k: The size of the quantile sketches used by `fit`
+
+    Atributes:
+    self.fences: Dictionary of column name -> (lower, upper)
+    self.rows_checked: The number of rows passed through `filter`/`filter_chunks`
+    self.rows_removed: The number of those rows that were removed
+
+    Methods:
+    fit(): Finds the fences in one pass over a stream of chunks with quantile sketches
+    fit_frame(): Finds the fences from the exact quantiles of an in-memory dataframe
+    mask(): Returns a boolean array, True for the rows to keep
+    outlier_rows(): Returns the index labels of the rows with outliers
+    filter(): Returns the dataframe without the rows with outliers
+    filter_chunks(): Filters a stream of chunks
+    """
+    def __init__(self, columns, threshold=1.5, policies=None, k=1000):
+        self.columns = list(columns)
+        self.policies = {col: {'method': 'iqr', 'threshold': threshold} for col in self.columns}
+        self.policies.update(policies or {})
+        self.k = k
+        self.fences = {}
+        self.rows_checked = 0
+        self.rows_removed = 0
+
+    def _quantiles_needed(self, col):
+        """
+        The function returns the quantiles the policy of a column needs.
+        """
+        policy = self.policies[col]
+        if policy['method'] == 'iqr':
+            return [0.25, 0.75]
+        if policy['method'] == 'quantile':
+            return [policy['lower'], policy['upper']]
+        return []
+
+    def _set_fences(self, col, quantiles):
+        """
+        The function turns the quantiles of a column into its (lower, upper) fences.
+        """
+        policy = self.policies[col]
+        method = policy['method']
+        if method == 'iqr':
+            q1, q3 = quantiles
+            iqr = q3 - q1
+            lower, upper = q1 - policy['threshold'] * iqr, q3 + policy['threshold'] * iqr
+        elif method == 'quantile':
+            lower, upper = quantiles
+        elif method == 'fixed':
+            lower, upper = policy.get('lower'), policy.get('upper')
+        elif method == 'none':
+            lower, upper = None, None
+        else:
+            raise ValueError(f"Unknown fence method {method} for {col}")
+        side = policy.get('side', 'both')
+        self.fences[col] = (lower if side != 'upper' else None, upper if side != 'lower' else None)
+
+    def fit(self, chunks):
+        """
+        The function finds the fences in a single pass over a stream of chunks. The quantiles come from
+        sketches, with a rank error of about 2/k (see `sketches.QuantileSketch`).
+
+        :return: The fitted OutlierFilter
+        """
+        sketches = {col: QuantileSketch(self.k) for col in self.columns if self._quantiles_needed(col)}
+        for chunk in chunks:
+            for col, sketch in sketches.items():
+                values = chunk[col].to_numpy(dtype='float64', na_value=np.nan)
+                sketch.update(values[~np.isnan(values)])
+        for col in self.columns:
+            quantiles = sketches[col].quantile(self._quantiles_needed(col)) if col in sketches else []
+            self._set_fences(col, quantiles)
+        return self
+
+    def fit_frame(self, df):
+        """
+        The function finds the fences from the exact quantiles of an in-memory dataframe.
+
+        :return: The fitted OutlierFilter
+        """
+        for col in self.columns:
+            needed = self._quantiles_needed(col)
+            self._set_fences(col, df[col].quantile(needed).tolist() if needed else [])
+        return self
+
+    def mask(self, df):
+        """
+        The function returns a boolean numpy array with True for the rows of `df` that are inside the
+        fences of every column. Nulls are never outliers.
+        """
+        columns = [col for col in self.columns if self.fences[col] != (None, None)]
+        if not columns:
+            return np.ones(len(df), dtype=bool)
+        block = df[columns].to_numpy(dtype='float64', na_value=np.nan)
+        lower = np.array([-np.inf if self.fences[col][0] is None else self.fences[col][0] for col in columns])
+        upper = np.array([np.inf if self.fences[col][1] is None else self.fences[col][1] for col in columns])
+        return ~((block < lower) | (block > upper)).any(axis=1)
+
+    def outlier_rows(self, df):
+        """
+        The function returns the index labels of the rows of `df` with an outlier, without removing them.
+        """
+        return df.index[~self.mask(df)]
+
+    def filter(self, df):
+        """
+        The function returns `df` without the rows that have an outlier in any column.
+        """
+        keep = self.mask(df)
+        self.rows_checked += len(keep)
+        self.rows_removed += int(len(keep) - keep.sum())
+        return df[keep]
+
+    def filter_chunks(self, chunks):
+        """
+        The function filters a stream of chunks, the second pass after `fit`.
+
+        :return: A generator of the filtered chunks
+        """
+        for chunk in chunks:
+            yield self.filter(chunk)
@@ -0,0 +1,375 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sys
+import time
+
+import pandas as pd
+
+from db_utils import RDSDatabaseConnector
+from EDA import transform_loan_payments
+from EDA_DataFrameInfo import DataFrameInfo, DataFrameTransform
+from instrumentation import enable_from_environment
+from storage import file_fingerprint, load_frame
+
+
+class Node:
+    """
+    The Node class is one step of a Pipeline: a function, the names of the nodes whose outputs it takes
+    as arguments, and keyword parameters.
+
+    Paramaters:
+    name: The name of the node
+    function: The function run by the node, called as function(*upstream_outputs, **params)
+    inputs: List of the names of the upstream nodes
+    params: Dictionary of keyword arguments, part of the cache key so they must be JSON serialisable
+    volatile: If True the node always runs, e.g. to read an external database, and the nodes below it are
+    keyed on a hash of its output instead of its inputs
+    """
+    def __init__(self, name, function, inputs=(), params=None, volatile=False):
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.volatile = volatile
+
+
+class Pipeline:
+    """
+    The Pipeline class runs a DAG of nodes lazily and caches each node's output on disk under a content
+    hash of its code, parameters and inputs. The code is the node function and every module of this
+    repository it uses, directly or through other modules (see `local_sources`), so editing e.g.
+    `loan_payments_schema` or `OutlierFilter` changes the keys of the nodes using them. Changes to
+    installed libraries are not part of the key, clear the cache after upgrading them. Running a node
+    only runs the upstream nodes it needs whose cache entry is missing, so after a change only the
+    changed node and the nodes below it run again.
+    The cache is evicted least recently used first once it grows past `max_cache_bytes`.
+
+    Paramaters:
+    cache_dir: The directory of the cache
+    max_cache_bytes: The largest total size of the cache
+
+    Atributes:
+    self.nodes: Dictionary of node name -> Node
+    self.log: List of (node name, 'cached' or 'ran', seconds) for the last run
+
+    Methods:
+    add(): Adds a node
+    key(): Returns the cache key of a node
+    run(): Returns the output of a node, running or loading what it needs
+    evict(): Removes the least recently used cache entries over the size limit
+    """
+    def __init__(self, cache_dir='.pipeline_cache', max_cache_bytes=5 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.nodes = {}
+        self.log = []
+        self._keys = {}
+        self._outputs = {}
+
+    def add(self, name, function, inputs=(), params=None, volatile=False):
+        """
+        The function adds a node to the pipeline, its inputs must already have been added.
+        """
+        missing = [name for name in inputs if name not in self.nodes]
+        if missing:
+            raise KeyError(f"Unknown inputs {missing} for node {name}")
+        self.nodes[name] = Node(name, function, inputs, params, volatile)
+        return self
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def key(self, name):
+        """
+        The function returns the cache key of a node: a SHA-256 of its name, function source, the code it
+        depends on (see `local_sources`), parameters and the keys of its inputs. A volatile node
+        has to run to get its key, from a hash of its output.
+        """
+        if name in self._keys:
+            return self._keys[name]
+        node = self.nodes[name]
+        if node.volatile:
+            self._run_node(node)
+            return self._keys[name]
+        digest = hashlib.sha256()
+        digest.update(name.encode())
+        digest.update(_function_source(node.function).encode())
+        helpers, sources = local_sources(node.function)
+        for helper in helpers:
+            digest.update(_function_source(helper).encode())
+        for path in sources:
+            digest.update(file_digest(path).encode())
+        digest.update(json.dumps(node.params, sort_keys=True, default=str).encode())
+        for upstream in node.inputs:
+            digest.update(self.key(upstream).encode())
+        self._keys[name] = digest.hexdigest()
+        return self._keys[name]
+
+    def run(self, name):
+        """
+        The function returns the output of a node. It is loaded from the cache when its key is there,
+        otherwise the node runs, first getting the outputs of its inputs the same way.
+        """
+        if name in self._outputs:
+            return self._outputs[name]
+        node = self.nodes[name]
+        if node.volatile:
+            self.key(name)
+            return self._outputs[name]
+
+        path = self._path(self.key(name))
+        if os.path.exists(path):
+            start = time.perf_counter()
+            with open(path, 'rb') as r:
+                output = pickle.load(r)
+            #the modification time records the last use for LRU eviction
+            os.utime(path)
+            self.log.append((name, 'cached', time.perf_counter() - start))
+        else:
+            output = self._run_node(node)
+            self._store(path, output)
+        self._outputs[name] = output
+        return output
+
+    def _run_node(self, node):
+        """
+        The function runs a node on the outputs of its inputs.
+        """
+        arguments = [self.run(upstream) for upstream in node.inputs]
+        start = time.perf_counter()
+        output = node.function(*arguments, **node.params)
+        self.log.append((node.name, 'ran', time.perf_counter() - start))
+        if node.volatile:
+            self._keys[node.name] = output_hash(output)
+            self._outputs[node.name] = output
+        return output
+
+    def _store(self, path, output):
+        """
+        The function writes an output to the cache and evicts old entries if the cache is too large.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'wb') as w:
+            pickle.dump(output, w, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        The function removes the least recently used cache entries until the cache fits in `max_cache_bytes`.
+
+        :return: The number of entries removed
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith('.pkl'):
+                stat = os.stat(os.path.join(self.cache_dir, file_name))
+                entries.append((stat.st_mtime, stat.st_size, file_name))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, file_name in entries:
+            if total <= self.max_cache_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, file_name))
+            total -= size
+            removed += 1
+        return removed
+
+
+def _function_source(function):
+    """
+    The function returns the source code of a function for the cache key, or its qualified name when
+    the source is not available.
+    """
+    try:
+        return inspect.getsource(function)
+    except (OSError, TypeError):
+        return f"{getattr(function, '__module__', '')}.{getattr(function, '__qualname__', repr(function))}"
+
+
+def local_sources(function):
+    """
+    The function returns what the cache key of a node function depends on besides its own source: the
+    functions of its module that it calls, and the source files of the modules of this repository it
+    uses. These are the modules of the global names in its code (and in the code of those functions), and
+    the modules they import, e.g. a node calling `transform_loan_payments` depends on EDA.py and the
+    modules EDA.py imports.
+
+    :return: A list of the functions and a sorted list of file paths
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    function = inspect.unwrap(function)
+    home = inspect.getmodule(function)
+    helpers, modules = [], []
+    functions, seen = [function], set()
+    while functions:
+        current = functions.pop()
+        if current in seen or getattr(current, '__code__', None) is None:
+            continue
+        seen.add(current)
+        if current is not function:
+            helpers.append(current)
+        names, codes = set(), [current.__code__]
+        while codes:
+            code = codes.pop()
+            names.update(code.co_names)
+            codes.extend(constant for constant in code.co_consts if inspect.iscode(constant))
+        for name in sorted(names & current.__globals__.keys()):
+            value = current.__globals__[name]
+            module = value if inspect.ismodule(value) else inspect.getmodule(value)
+            if inspect.isfunction(value) and module is home:
+                functions.append(value)
+            elif module is not home:
+                modules.append(module)
+
+    sources = set()
+    while modules:
+        module = modules.pop()
+        path = os.path.abspath(getattr(module, '__file__', None) or '')
+        if module is None or not path.endswith('.py') or path in sources or os.path.dirname(path) != root:
+            continue
+        sources.add(path)
+        for value in vars(module).values():
+            modules.append(value if inspect.ismodule(value) else inspect.getmodule(value))
+    return sorted(helpers, key=lambda helper: helper.__qualname__), sorted(sources)
+
+
+_file_digests = {}
+
+
+def file_digest(path):
+    """
+    The function returns a SHA-256 of a file's contents, computed once per modification of the file.
+    """
+    stat = os.stat(path)
+    cached = _file_digests.get(path)
+    if cached is None or cached[0] != (stat.st_mtime_ns, stat.st_size):
+        with open(path, 'rb') as r:
+            cached = ((stat.st_mtime_ns, stat.st_size), hashlib.sha256(r.read()).hexdigest())
+        _file_digests[path] = cached
+    return cached[1]
+
+
+def output_hash(output):
+    """
+    The function returns a SHA-256 of a node output, hashing DataFrames by their values.
+    """
+    digest = hashlib.sha256()
+    if isinstance(output, pd.DataFrame):
+        digest.update(json.dumps([list(map(str, output.columns)), list(map(str, output.dtypes))]).encode())
+        digest.update(pd.util.hash_pandas_object(output, index=True).to_numpy().tobytes())
+    else:
+        digest.update(pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL))
+    return digest.hexdigest()
+
+
+#columns used by the loan pipeline, as listed in EDA_DataFrameInfo.py
+mode_impute = ['last_credit_pull_date', 'next_payment_date', 'last_payment_date', 'employment_length', 'term']
+median_impute = ['collections_12_mths_ex_med', 'mths_since_last_delinq', 'int_rate', 'funded_amount']
+skewed_cols = ['annual_inc', 'delinq_2yrs', 'inq_last_6mths', 'open_accounts', 'out_prncp', 'out_prncp_inv', 'total_payment',
+               'total_payment_inv', 'total_rec_prncp', 'total_rec_int', 'total_rec_late_fee', 'recoveries',
+               'collection_recovery_fee', 'last_payment_amount', 'collections_12_mths_ex_med']
+cols_for_drop = ['mths_since_last_record', 'mths_since_last_major_derog']
+
+
+def load_source(source):
+    """
+    The function loads the raw loan payments table from a file (`source` is a `file_fingerprint`).
+    """
+    return load_frame(source['path'])
+
+
+def extract_from_database(database_credentials_dict, table='loan_payments', snapshot_path='loan_payments.parquet'):
+    """
+    The function brings the local snapshot up to date with `RDSDatabaseConnector.incremental_sync` and
+    returns it.
+    """
+    RDSDatabaseConnector(database_credentials_dict).incremental_sync(table, snapshot_path)
+    return load_frame(snapshot_path)
+
+
+def transform_types(df):
+    """
+    The function applies the `DataTransform` schema conversions.
+    """
+    return transform_loan_payments(df.copy())
+
+
+def clean(df, cols_for_drop, mode_impute, median_impute):
+    """
+    The function drops the mostly empty columns and imputes the nulls with `DataFrameTransform`.
+    """
+    transform = DataFrameTransform(df.copy())
+    transform.columns_to_drop(cols_for_drop)
+    transform.impute_nulls_with_mode(mode_impute)
+    transform.impute_nulls_with_median(median_impute)
+    return transform.df
+
+
+def reduce_skew(df, skewed_cols, method):
+    """
+    The function applies `DataFrameTransform.log_transformation` to the skewed columns.
+    """
+    transform = DataFrameTransform(df.copy())
+    transform.log_transformation(skewed_cols, method)
+    return transform.df
+
+
+def drop_outliers(df, threshold):
+    """
+    The function applies `DataFrameTransform.remove_outliers` to the numeric columns.
+    """
+    transform = DataFrameTransform(df)
+    transform.remove_outliers(df.select_dtypes(include='number').columns.tolist(), threshold)
+    return transform.df
+
+
+def profile(df):
+    """
+    The function returns the `DataFrameInfo.profile` statistics.
+    """
+    return DataFrameInfo(df).profile()
+
+
+def build_loan_pipeline(source='loan_payments.parquet', database_credentials_dict=None, cache_dir='.pipeline_cache',
+                        max_cache_bytes=5 * 1024 ** 3, skew_method='log', outlier_threshold=1.5):
+    """
+    The function builds the loan payments pipeline: extraction -> DataTransform -> DataFrameTransform
+    steps, with the profile of the transformed and the cleaned data as analysis outputs.
+
+    :param source: The raw table file, used when no database credentials are given
+    :param database_credentials_dict: If given, the 'raw' node syncs `source` from the database on every run
+    :return: The Pipeline, e.g. `build_loan_pipeline().run('without_outliers')`
+    """
+    pipeline = Pipeline(cache_dir, max_cache_bytes)
+    if database_credentials_dict is not None:
+        pipeline.add('raw', extract_from_database, params={'database_credentials_dict': database_credentials_dict,
+                                                           'snapshot_path': source}, volatile=True)
+    else:
+        pipeline.add('raw', load_source, params={'source': file_fingerprint(source)})
+    pipeline.add('transformed', transform_types, ['raw'])
+    pipeline.add('cleaned', clean, ['transformed'], {'cols_for_drop': cols_for_drop, 'mode_impute': mode_impute,
+                                                     'median_impute': median_impute})
+    pipeline.add('skew_reduced', reduce_skew, ['cleaned'], {'skewed_cols': skewed_cols, 'method': skew_method})
+    pipeline.add('without_outliers', drop_outliers, ['skew_reduced'], {'threshold': outlier_threshold})
+    pipeline.add('transformed_profile', profile, ['transformed'])
+    pipeline.add('cleaned_profile', profile, ['without_outliers'])
+    return pipeline
+
+
+if __name__ == '__main__':
+    enable_from_environment()
+    targets = sys.argv[1:] or ['without_outliers', 'cleaned_profile']
+    loan_pipeline = build_loan_pipeline()
+    for target in targets:
+        output = loan_pipeline.run(target)
+        print(target, getattr(output, 'shape', type(output)))
+    for name, status, seconds in loan_pipeline.log:
+        print(f"{name}: {status} in {seconds:.2f}s")
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+
+def _finite(values):
+    """
+    The function returns the finite values of a Series or array as a float numpy array.
+    """
+    if isinstance(values, pd.Series):
+        values = values.to_numpy(dtype='float64', na_value=np.nan)
+    values = np.asarray(values, dtype='float64')
+    return values[np.isfinite(values)]
+
+
+def histogram_1d(values, bins=50):
+    """
+    The function counts the values of a column in `bins` equal-width bins.
+
+    :param values: A pandas Series or numpy array of numbers, nulls are ignored
+    :return: The counts and the bin edges (one more edge than counts)
+    """
+    values = _finite(values)
+    if len(values) == 0:
+        return np.zeros(bins, dtype='int64'), np.linspace(0, 1, bins + 1)
+    return np.histogram(values, bins=bins)
+
+
+def binned_kde(counts, edges, bandwidth=None):
+    """
+    The function estimates a Gaussian kernel density from binned counts by convolving the counts with
+    the kernel, so its cost depends on the number of bins and not on the number of rows. The result is
+    scaled to the counts so it can be drawn over the histogram.
+
+    :param counts: The histogram counts
+    :param edges: The bin edges
+    :param bandwidth: The kernel standard deviation, by default Scott's rule from the binned variance
+    :return: The smoothed counts at the bin centres
+    """
+    total = counts.sum()
+    width = edges[1] - edges[0]
+    if total == 0 or width == 0:
+        return counts.astype('float64')
+    centres = (edges[:-1] + edges[1:]) / 2
+    if bandwidth is None:
+        mean = np.sum(counts * centres) / total
+        std = np.sqrt(np.sum(counts * (centres - mean) ** 2) / total)
+        bandwidth = 1.06 * std * total ** (-1 / 5) if std > 0 else width
+    sigma = max(bandwidth / width, 1e-3)
+    half_width = int(np.ceil(4 * sigma))
+    offsets = np.arange(-half_width, half_width + 1)
+    kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+    kernel /= kernel.sum()
+    return np.convolve(counts, kernel, mode='same')
+
+
+def histogram_2d(x, y, bins=100):
+    """
+    The function counts the rows in a `bins` x `bins` grid over two columns, the density grid drawn in
+    place of a scatter plot of every row.
+
+    :param x: A pandas Series or numpy array of numbers
+    :param y: A pandas Series or numpy array of numbers, the same length as `x`
+    :return: The counts (x bins by y bins), the x edges and the y edges
+    """
+    if isinstance(x, pd.Series):
+        x = x.to_numpy(dtype='float64', na_value=np.nan)
+    if isinstance(y, pd.Series):
+        y = y.to_numpy(dtype='float64', na_value=np.nan)
+    x, y = np.asarray(x, dtype='float64'), np.asarray(y, dtype='float64')
+    present = np.isfinite(x) & np.isfinite(y)
+    if not present.any():
+        return np.zeros((bins, bins), dtype='int64'), np.linspace(0, 1, bins + 1), np.linspace(0, 1, bins + 1)
+    return np.histogram2d(x[present], y[present], bins=bins)
+
+
+def missingness_blocks(df, n_blocks=200):
+    """
+    The function splits the rows into `n_blocks` consecutive blocks and returns the share of missing
+    values of each column in each block, the matrix drawn by `plotter.msno_matrix`.
+
+    :return: A numpy array of n_blocks rows by one column per dataframe column, values from 0 to 1
+    """
+    missing = df.isna().to_numpy(dtype='int32')
+    n_blocks = max(1, min(n_blocks, len(df)))
+    starts = np.linspace(0, len(df), n_blocks + 1).astype('int64')[:-1]
+    if len(df) == 0:
+        return np.zeros((0, df.shape[1]))
+    sums = np.add.reduceat(missing, starts, axis=0)
+    sizes = np.diff(np.append(starts, len(df)))
+    return sums / sizes[:, None]
+
+
+def box_stats(df, group_column, value_column, whisker=1.5, max_groups=30):
+    """
+    The function computes the statistics of a box plot for each group: quartiles, median, and whiskers at
+    the furthest values within `whisker` * IQR of the box. A numeric group column with more than
+    `max_groups` values is split into `max_groups` quantile bins.
+
+    :return: A list of dictionaries for matplotlib's `Axes.bxp`
+    """
+    groups = df[group_column]
+    if pd.api.types.is_numeric_dtype(groups.dtype) and groups.nunique() > max_groups:
+        groups = pd.qcut(groups, max_groups, duplicates='drop')
+    values = df[value_column]
+    grouped = values.groupby(groups, observed=True)
+    quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    iqr = quartiles[0.75] - quartiles[0.25]
+    low_fence = (quartiles[0.25] - whisker * iqr).reindex(groups).to_numpy()
+    high_fence = (quartiles[0.75] + whisker * iqr).reindex(groups).to_numpy()
+    inside = (values.to_numpy(dtype='float64', na_value=np.nan) >= low_fence) & (values.to_numpy(dtype='float64', na_value=np.nan) <= high_fence)
+    whiskers = values[inside].groupby(groups[inside], observed=True).agg(['min', 'max'])
+    stats = []
+    for label, row in quartiles.iterrows():
+        stats.append({
+            'label': str(label),
+            'q1': row[0.25], 'med': row[0.5], 'q3': row[0.75],
+            'whislo': whiskers['min'].get(label, row[0.25]), 'whishi': whiskers['max'].get(label, row[0.75]),
+            'fliers': [],
+        })
+    return stats
+
+
+def stratified_sample(df, column, n, seed=0):
+    """
+    The function samples about `n` rows keeping the share of each value of `column`, with at least one
+    row of every value, for plots that need raw points.
+
+    :param df: The pandas DataFrame
+    :param column: The column to stratify on, e.g. 'loan_status'
+    :param n: The number of rows wanted
+    :param seed: The random seed
+    :return: The sampled rows in their original order
+    """
+    if len(df) <= n:
+        return df
+    fraction = n / len(df)
+    sizes = df[column].value_counts(dropna=False)
+    take = np.minimum(np.maximum(1, np.round(sizes * fraction)), sizes)
+    shuffled = df.iloc[np.random.default_rng(seed).permutation(len(df))]
+    position = shuffled.groupby(column, observed=True, dropna=False).cumcount().to_numpy()
+    limit = shuffled[column].map(take).to_numpy(dtype='float64', na_value=take.get(np.nan, 0))
+    return shuffled[position < limit].sort_index()
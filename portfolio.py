@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+
+
+#loan_status values counted as a loss and as behind on payments, as in the original loss analysis
+CHARGED_OFF = ('Charged Off',)
+LATE = ('Late (31-120 days)',)
+
+#per-loan amounts summed for each loan_status by `status_summary`
+AMOUNTS = ['loan_amount', 'funded_amount', 'funded_amount_inv', 'total_payment', 'total_payment_inv', 'out_prncp',
+           'out_prncp_inv', 'recoveries', 'instalment']
+
+
+def term_months(term):
+    """
+    The function returns the term of each loan in months as a float numpy array, from either the number
+    or the original '36 months' text. The text is parsed once per distinct value, not once per loan.
+    Missing terms are NaN.
+    """
+    if pd.api.types.is_numeric_dtype(term.dtype):
+        return term.to_numpy(dtype='float64', na_value=np.nan)
+    codes, uniques = pd.factorize(term)
+    months = pd.to_numeric(pd.Series(uniques, dtype='string').str.extract(r'(\d+)')[0]).to_numpy(dtype='float64', na_value=np.nan)
+    return np.where(codes >= 0, months[codes], np.nan)
+
+
+def remaining_instalments(df):
+    """
+    The function returns the number of scheduled instalments each loan has not paid yet: the term less
+    the number of whole instalments covered by the payments so far, never below 0. Loans without a term
+    or instalment have 0.
+    """
+    term = term_months(df['term'])
+    instalment = df['instalment'].to_numpy(dtype='float64', na_value=np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        paid = np.floor(df['total_payment'].to_numpy(dtype='float64', na_value=np.nan) / instalment)
+    remaining = np.clip(term - paid, 0, term)
+    return np.nan_to_num(remaining, nan=0.0, posinf=0.0).astype('int64')
+
+
+def loan_metrics(df):
+    """
+    The function computes the amounts of each loan used by the loss analysis, all as vectorised column
+    operations:
+    - expected_revenue: instalment * term, what the loan pays over its full term
+    - revenue_lost: expected_revenue less the payments received, never below 0
+    - remaining_revenue: the instalments not paid yet, `remaining_instalments` * instalment
+    - amount_lost: funded_amount less the payments received, never below 0
+
+    :return: A DataFrame with one row per loan
+    """
+    instalment = df['instalment'].to_numpy(dtype='float64', na_value=np.nan)
+    paid = df['total_payment'].to_numpy(dtype='float64', na_value=np.nan)
+    expected = np.nan_to_num(instalment * term_months(df['term']))
+    return pd.DataFrame({
+        'expected_revenue': expected,
+        'revenue_lost': np.clip(expected - np.nan_to_num(paid), 0, None),
+        'remaining_revenue': remaining_instalments(df) * np.nan_to_num(instalment),
+        'amount_lost': np.clip(df['funded_amount'].to_numpy(dtype='float64', na_value=np.nan) - paid, 0, None),
+    }, index=df.index)
+
+
+def status_summary(df, by='loan_status'):
+    """
+    The function computes the recovery, loss and revenue figures of every loan_status in one grouped pass:
+    the number and share of loans, the sums of `AMOUNTS` and `loan_metrics`, and the percentages
+
+    - recovered_percentage: payments received / funded_amount
+    - recovered_inv_percentage: investor payments received / funded_amount_inv
+    - revenue_lost_percentage: revenue_lost / expected_revenue
+    - expected_revenue_share: the share of the portfolio's expected revenue
+
+    :param df: The loan payments dataframe
+    :param by: The column to group by
+    :return: A DataFrame with one row per value of `by`
+    """
+    columns = [col for col in AMOUNTS if col in df.columns]
+    frame = pd.concat([df[columns], loan_metrics(df)], axis=1)
+    frame.insert(0, 'loans', 1)
+    summary = frame.groupby(df[by], observed=True).sum()
+    summary['loan_share'] = summary['loans'] / summary['loans'].sum() * 100
+    summary['expected_revenue_share'] = summary['expected_revenue'] / summary['expected_revenue'].sum() * 100
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summary['recovered_percentage'] = summary['total_payment'] / summary['funded_amount'] * 100
+        summary['recovered_inv_percentage'] = summary['total_payment_inv'] / summary['funded_amount_inv'] * 100
+        summary['revenue_lost_percentage'] = summary['revenue_lost'] / summary['expected_revenue'] * 100
+    return summary
+
+
+def loss_summary(summary, charged_off=CHARGED_OFF, late=LATE):
+    """
+    The function returns the figures of the loss analysis from a `status_summary`: the charged off loans,
+    the late loans and what the late loans would cost if they were charged off.
+
+    :return: A dictionary of figure name -> value
+    """
+    def total(statuses, column):
+        return summary.loc[summary.index.isin(statuses), column].sum()
+
+    loans = summary['loans'].sum()
+    figures = {
+        'loans': int(loans),
+        'charged_off_loans': int(total(charged_off, 'loans')),
+        'charged_off_percentage': total(charged_off, 'loans') / loans * 100,
+        'charged_off_paid': total(charged_off, 'total_payment'),
+        'charged_off_amount_lost': total(charged_off, 'amount_lost'),
+        'charged_off_expected_revenue': total(charged_off, 'expected_revenue'),
+        'charged_off_revenue_lost': total(charged_off, 'revenue_lost'),
+        'late_loans': int(total(late, 'loans')),
+        'late_percentage': total(late, 'loans') / loans * 100,
+        'late_paid': total(late, 'total_payment'),
+        'late_outstanding_principal': total(late, 'out_prncp'),
+        'late_possible_loss': total(late, 'remaining_revenue'),
+    }
+    figures['charged_off_revenue_lost_percentage'] = figures['charged_off_revenue_lost'] / figures['charged_off_expected_revenue'] * 100 \
+        if figures['charged_off_expected_revenue'] else np.nan
+    at_risk = tuple(charged_off) + tuple(late)
+    figures['at_risk_percentage'] = total(at_risk, 'loans') / loans * 100
+    figures['at_risk_expected_revenue_percentage'] = total(at_risk, 'expected_revenue') / summary['expected_revenue'].sum() * 100
+    return figures
+
+
+def _group_codes(df, by):
+    """
+    The function returns the group number of each loan and the group labels.
+    """
+    codes, labels = pd.factorize(df[by], sort=True)
+    return codes, labels
+
+
+def projected_payments(df, months=None, by='loan_status'):
+    """
+    The function projects the scheduled instalments still to be paid in each future month, for each
+    group, if every loan paid its remaining instalments on time. A loan with r instalments left pays its
+    instalment in months 1 to r; the loans are counted once into a (groups x months) array with
+    `np.bincount` and a reverse cumulative sum gives the monthly totals, so the work is one pass over the
+    loans plus the size of the result.
+
+    :param months: The number of months, by default the longest remaining term
+    :return: A DataFrame with one row per group and one column per month, `.to_numpy()` for the array
+    """
+    codes, labels = _group_codes(df, by)
+    remaining = remaining_instalments(df)
+    months = int(remaining.max(initial=0)) if months is None else months
+    instalment = np.nan_to_num(df['instalment'].to_numpy(dtype='float64', na_value=np.nan))
+    present = codes >= 0
+    #a loan with more than `months` left pays in every month, so it is counted in the last bucket
+    buckets = codes[present] * (months + 1) + np.minimum(remaining[present], months)
+    by_remaining = np.bincount(buckets, weights=instalment[present], minlength=len(labels) * (months + 1))
+    by_remaining = by_remaining.reshape(len(labels), months + 1)
+    payments = np.cumsum(by_remaining[:, ::-1], axis=1)[:, ::-1][:, 1:]
+    return pd.DataFrame(payments, index=labels, columns=pd.RangeIndex(1, months + 1, name='month'))
+
+
+def amortization_schedule(df, months=60, by='loan_status', chunksize=100000):
+    """
+    The function projects the outstanding principal of each loan (out_prncp) month by month at its
+    interest rate (int_rate, APR) and instalment, and sums the payment, interest, principal and balance of
+    each month for each group. The balance of every loan and month comes from the closed form of the
+    annuity, B_t = B_0 (1 + i)^t - p ((1 + i)^t - 1) / i, computed on a (loans x months) array one chunk of
+    loans at a time and summed into the groups with a matrix product. Loans without a balance, rate or
+    instalment are left out.
+
+    :param months: The number of months projected
+    :param chunksize: The number of loans projected at a time
+    :return: A dictionary of 'payment', 'interest', 'principal' and 'balance' -> DataFrame with one row
+    per group and one column per month
+    """
+    codes, labels = _group_codes(df, by)
+    balance_0 = df['out_prncp'].to_numpy(dtype='float64', na_value=np.nan)
+    rate = df['int_rate'].to_numpy(dtype='float64', na_value=np.nan) / 1200
+    instalment = df['instalment'].to_numpy(dtype='float64', na_value=np.nan)
+    active = np.flatnonzero((codes >= 0) & (balance_0 > 0) & np.isfinite(rate) & (instalment > 0))
+    totals = {name: np.zeros((len(labels), months)) for name in ('payment', 'interest', 'principal', 'balance')}
+    t = np.arange(1, months + 1)
+
+    for start in range(0, len(active), chunksize):
+        rows = active[start:start + chunksize]
+        b0, i, p = balance_0[rows, None], rate[rows, None], instalment[rows, None]
+        growth = (1 + i) ** t
+        with np.errstate(divide='ignore', invalid='ignore'):
+            balance = np.where(i > 0, b0 * growth - p * (growth - 1) / i, b0 - p * t)
+        balance = np.maximum(balance, 0)
+        previous = np.hstack([b0, balance[:, :-1]])
+        interest = previous * i
+        payment = np.minimum(p, previous + interest)
+        groups = np.zeros((len(rows), len(labels)))
+        groups[np.arange(len(rows)), codes[rows]] = 1
+        totals['payment'] += groups.T @ payment
+        totals['interest'] += groups.T @ np.where(payment > 0, interest, 0)
+        totals['principal'] += groups.T @ (payment - np.where(payment > 0, interest, 0))
+        totals['balance'] += groups.T @ balance
+
+    columns = pd.RangeIndex(1, months + 1, name='month')
+    return {name: pd.DataFrame(values, index=labels, columns=columns) for name, values in totals.items()}
+
+
+def recovery_projection(df, months=6):
+    """
+    The function returns the percentage of the total funded amount recovered so far (month 0) and by the
+    end of each of the next `months` months, adding the payments projected by `amortization_schedule`.
+
+    :return: A pandas Series of month -> percentage recovered
+    """
+    funded = df['funded_amount'].sum()
+    paid = df['total_payment'].sum()
+    payments = amortization_schedule(df, months)['payment'].sum(axis=0).to_numpy()
+    recovered = paid + np.concatenate([[0], np.cumsum(payments)])
+    return pd.Series(recovered / funded * 100, index=pd.RangeIndex(0, months + 1, name='month'))
+
+
+if __name__ == '__main__':
+    from storage import load_snapshot, stage_path
+    df = load_snapshot(stage_path('cleaned_loan_payments', 'arrow'))
+    summary = status_summary(df)
+    print(summary.to_string())
+    for name, value in loss_summary(summary).items():
+        print(f"{name}: {round(value, 2)}")
+    print(recovery_projection(df).round(2).to_string())
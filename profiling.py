@@ -0,0 +1,297 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from sketches import DistinctCounter, FrequencyCounter, Moments, QuantileSketch
+from storage import _file_format, iter_chunks, open_snapshot
+
+
+#quantiles reported in the summary, the same as DataFrame.describe()
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+class ColumnProfile:
+    """
+    The ColumnProfile class collects the statistics of one column from a stream of chunks: the count,
+    null count, moments and quantile sketch of numbers and dates, the value frequencies of categories,
+    text and booleans, and a distinct-value counter. Profiles of the same column built on different
+    chunks or processes can be merged.
+
+    Paramaters:
+    k: The size of the quantile sketch
+    precision: The precision of the distinct-value counter
+    seed: Seed of the quantile sketch, profiles that will be merged need different seeds so their
+    sketches make independent random choices
+
+    Atributes:
+    self.kind: 'numeric', 'datetime' or 'other', set from the first chunk
+    self.rows: The number of rows seen
+    self.nulls: The number of null values seen
+
+    Methods:
+    update(): Adds the values of the column in one chunk
+    merge(): Adds another profile of the same column
+    summary(): Returns the statistics as a dictionary
+    """
+    def __init__(self, k=200, precision=14, seed=0):
+        self.kind = None
+        self.rows = 0
+        self.nulls = 0
+        self.moments = Moments()
+        self.quantiles = QuantileSketch(k, seed=seed)
+        self.distinct = DistinctCounter(precision)
+        self.frequencies = FrequencyCounter()
+
+    def update(self, series):
+        """
+        The function adds the values of the column in one chunk.
+        """
+        if self.kind is None:
+            self.kind = column_kind(series)
+        self.rows += len(series)
+        present = series.dropna()
+        self.nulls += len(series) - len(present)
+        self.distinct.update(present)
+        if self.kind == 'other' or pd.api.types.is_bool_dtype(series.dtype):
+            self.frequencies.update(present)
+        if self.kind == 'numeric':
+            values = present.to_numpy(dtype='float64')
+        elif self.kind == 'datetime':
+            values = present.to_numpy(dtype='datetime64[ns]').astype('int64').astype('float64')
+        else:
+            return
+        self.moments.update(values)
+        self.quantiles.update(values)
+
+    def merge(self, other):
+        """
+        The function adds another profile of the same column to this one.
+        """
+        self.kind = self.kind or other.kind
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.moments.merge(other.moments)
+        self.quantiles.merge(other.quantiles)
+        self.distinct.merge(other.distinct)
+        self.frequencies.merge(other.frequencies)
+        return self
+
+    def summary(self):
+        """
+        The function returns the statistics of the column as a dictionary.
+        """
+        summary = {
+            'count': self.rows - self.nulls,
+            'nulls': self.nulls,
+            'null_percentage': self.nulls * 100 / self.rows if self.rows else np.nan,
+            #the estimate of the distinct counter can be above the number of values
+            'distinct': min(self.distinct.count(), self.rows - self.nulls),
+        }
+        if self.frequencies.counts:
+            top = self.frequencies.top(1)
+            summary.update({'top': top.index[0], 'freq': top.iloc[0]})
+        if self.kind in ('numeric', 'datetime'):
+            statistics = {'mean': self.moments.mean if self.moments.count else np.nan,
+                          'std': np.sqrt(self.moments.variance()),
+                          'min': self.moments.min}
+            statistics.update({f"{q:.0%}": value for q, value in zip(QUANTILES, self.quantiles.quantile(QUANTILES))})
+            statistics['max'] = self.moments.max
+            if self.kind == 'datetime':
+                #report dates as dates, the spread as a duration
+                statistics = {name: pd.Timedelta(value, 'ns') if name == 'std' else pd.Timestamp(value, unit='ns')
+                              if not np.isnan(value) else pd.NaT for name, value in statistics.items()}
+            summary.update(statistics)
+        return summary
+
+
+def column_kind(series):
+    """
+    The function returns how a column is profiled: 'numeric' (numbers and booleans), 'datetime' or 'other'.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return 'datetime'
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return 'other'
+    if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+        return 'numeric'
+    return 'other'
+
+
+class StreamingProfiler:
+    """
+    The StreamingProfiler class profiles a table in a single pass over a stream of chunks, holding only
+    one chunk and a fixed-size state per column in memory. It replaces the separate full scans of
+    `DataFrameInfo.Extract_stats`, `null_count` and `distinct_values_categories`.
+
+    Error bounds, the same whether the state was built in one pass or merged from partitions:
+    - count, nulls, minimum, maximum: exact
+    - mean and standard deviation: exact up to floating point rounding (relative error around 1e-12)
+    - value frequencies ('top', 'freq', `top_values`): exact up to 1000 distinct values, then each count
+      is at most rows / 1001 too low
+    - quantiles: rank error of about 2/k
+    - distinct counts: exact up to 2048 values, then a relative standard error of 1.04 / sqrt(2**precision),
+      and never more than the count
+
+    Paramaters:
+    k: The size of the quantile sketches
+    precision: The precision of the distinct-value counters
+    seed: Seed of the quantile sketches, each column's sketch is seeded with (seed, column number). The
+    profilers of partitions that will be merged need different seeds, e.g. the partition number
+
+    Atributes:
+    self.columns: Dictionary of column name -> ColumnProfile
+    self.rows: The number of rows seen
+
+    Methods:
+    update(): Adds a chunk of the table
+    merge(): Adds the state of another profiler, e.g. from another partition
+    summary(): Returns the statistics of every column as a DataFrame
+    top_values(): Returns the most frequent values of a column
+    """
+    def __init__(self, k=200, precision=14, seed=0):
+        self.k = k
+        self.precision = precision
+        self.seed = seed
+        self.columns = {}
+        self.rows = 0
+
+    def update(self, chunk):
+        """
+        The function adds a chunk (pandas DataFrame) of the table.
+        """
+        for col in chunk.columns:
+            if col not in self.columns:
+                self.columns[col] = ColumnProfile(self.k, self.precision, seed=[self.seed, len(self.columns)])
+            self.columns[col].update(chunk[col])
+        self.rows += len(chunk)
+        return self
+
+    def merge(self, other):
+        """
+        The function adds the state of another profiler to this one.
+        """
+        for col, profile in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(profile)
+            else:
+                self.columns[col] = profile
+        self.rows += other.rows
+        return self
+
+    def summary(self):
+        """
+        The function returns a DataFrame with one row of statistics per column.
+        """
+        return pd.DataFrame({col: profile.summary() for col, profile in self.columns.items()}).T
+
+    def top_values(self, col, k=5):
+        """
+        The function returns the k most frequent values of a category, text or boolean column and their counts.
+        """
+        return self.columns[col].frequencies.top(k)
+
+
+def profile_chunks(chunks, k=200, precision=14, seed=0):
+    """
+    The function profiles a stream of DataFrame chunks in one pass.
+
+    :param chunks: An iterable of pandas DataFrames with the same columns
+    :param seed: Seed of the quantile sketches, see `StreamingProfiler`
+    :return: The StreamingProfiler holding the state, call `summary()` for the statistics
+    """
+    profiler = StreamingProfiler(k, precision, seed)
+    for chunk in chunks:
+        profiler.update(chunk)
+    return profiler
+
+
+def profile_file(path, chunksize=100000, columns=None, k=200, precision=14):
+    """
+    The function profiles a Parquet, Arrow or CSV file in one pass without loading it into memory.
+
+    :return: The StreamingProfiler holding the state, call `summary()` for the statistics
+    """
+    return profile_chunks(iter_chunks(path, chunksize, columns), k, precision)
+
+
+def parallel_profile_chunks(chunks, workers=None, k=200, precision=14, in_flight=None):
+    """
+    The function profiles each chunk in a process pool and merges the states in chunk order. At most
+    `in_flight` chunks are sent to the pool at a time, so a generator of chunks is read as the workers
+    get through it and memory stays bounded by the chunk size. Each chunk's sketches are seeded with its
+    number, so their random choices are independent. For a file use `parallel_profile_file`,
+    whose workers read their own part of the file instead of being sent the chunks.
+
+    :param chunks: An iterable of pandas DataFrames with the same columns
+    :param workers: The number of processes, by default the number of CPUs
+    :param in_flight: The largest number of chunks sent and not yet merged, by default 2 * workers
+    :return: The merged StreamingProfiler, call `summary()` for the statistics
+    """
+    workers = workers or os.cpu_count()
+    in_flight = in_flight or 2 * workers
+    profiler = StreamingProfiler(k, precision)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for number, chunk in enumerate(chunks):
+            if len(pending) >= in_flight:
+                profiler.merge(pending.popleft().result())
+            pending.append(executor.submit(profile_chunks, [chunk], k, precision, number))
+        while pending:
+            profiler.merge(pending.popleft().result())
+    return profiler
+
+
+def _profile_partition(path, start, stop, columns, k, precision, seed):
+    """
+    The function profiles rows `start` to `stop` of a Parquet or Arrow file in a worker process. For
+    Parquet files `start` and `stop` are row group numbers, and `seed` is the partition number.
+    """
+    profiler = StreamingProfiler(k, precision, seed)
+    if _file_format(path) == 'parquet':
+        parquet_file = pq.ParquetFile(path)
+        for row_group in range(start, stop):
+            profiler.update(parquet_file.read_row_group(row_group, columns=columns).to_pandas())
+    else:
+        table = open_snapshot(path, columns).slice(start, stop - start)
+        for batch in table.to_batches(max_chunksize=100000):
+            profiler.update(batch.to_pandas())
+    return profiler
+
+
+def parallel_profile_file(path, workers=None, columns=None, k=200, precision=14, chunksize=100000):
+    """
+    The function profiles a Parquet file (split by row groups) or an Arrow snapshot (split by rows) in a
+    process pool. Each worker builds the state of its partition independently and the states are merged
+    in partition order, so the result does not depend on which worker finishes first. A CSV file can't be
+    split without reading it, so its chunks are read here and sent to the pool (`parallel_profile_chunks`).
+    The error bounds are those of `StreamingProfiler`.
+
+    :param path: A file read by `storage.iter_chunks`, e.g. a .parquet file written by `save_frame`/`save_chunks`
+    or an .arrow snapshot
+    :param workers: The number of processes, by default the number of CPUs
+    :param columns: A list of column names to profile, or None for all columns
+    :param chunksize: The number of rows of each chunk of a CSV file
+    :return: The merged StreamingProfiler, call `summary()` for the statistics
+    """
+    workers = workers or os.cpu_count()
+    file_format = _file_format(path)
+    if file_format == 'csv':
+        return parallel_profile_chunks(iter_chunks(path, chunksize, columns), workers, k, precision)
+    path = os.fspath(path)
+    if file_format == 'parquet':
+        total = pq.ParquetFile(path).num_row_groups
+    else:
+        total = open_snapshot(path).num_rows
+    edges = np.unique(np.linspace(0, total, workers + 1).astype('int64'))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partitions = executor.map(_profile_partition, repeat(path), edges[:-1], edges[1:],
+                                  repeat(columns), repeat(k), repeat(precision), range(len(edges) - 1))
+        profiler = StreamingProfiler(k, precision)
+        for partition in partitions:
+            profiler.merge(partition)
+    return profiler
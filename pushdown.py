@@ -0,0 +1,259 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import BigInteger, Boolean, Date, DateTime, Float, Integer, MetaData, Numeric, String, Table, case, cast, distinct, func, select, true, type_coerce
+
+from EDA import convert_column, loan_payments_schema, months_from_ordinals
+
+
+#the SQL below only uses functions shared by PostgreSQL, MySQL and SQLite: SUBSTR, REPLACE, TRIM, ROUND,
+#CASE, CAST, COUNT, MIN, MAX and AVG
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def reflect_table(engine, table):
+    """
+    The function reads the columns and types of a table from the database.
+
+    :return: A SQLAlchemy Table
+    """
+    return Table(table, MetaData(), autoload_with=engine)
+
+
+def month_ordinal(column, format='%b-%Y'):
+    """
+    The function builds the SQL expression of the number of months since January 1970 of a column of
+    fixed-width month strings, e.g. 'Dec-2018' with the format '%b-%Y', the same value as
+    `EDA.parse_months(output='ordinal')`. Only the %b, %m and %Y fields are supported.
+
+    :return: The SQL expression, or None if the format can't be parsed in SQL
+    """
+    position, year, month = 1, None, None
+    fields = iter(format.replace('%%', '\0'))
+    for character in fields:
+        if character != '%':
+            position += 1
+            continue
+        field = next(fields, '')
+        if field == 'Y':
+            year = cast(func.substr(column, position, 4), Integer)
+            position += 4
+        elif field == 'm':
+            month = cast(func.substr(column, position, 2), Integer)
+            position += 2
+        elif field == 'b':
+            month = case({name: number for number, name in enumerate(MONTH_NAMES, 1)}, value=func.substr(column, position, 3))
+            position += 3
+        else:
+            return None
+    if year is None or month is None:
+        return None
+    return (year - 1970) * 12 + month - 1
+
+
+def term_months(column):
+    """
+    The function builds the SQL expression of the number of months in a term such as '36 months', the
+    server side version of `DataTransform.term_to_int`.
+    """
+    return cast(func.trim(func.replace(column, 'months', '')), Integer)
+
+
+def sortable_column(table, name, schema=loan_payments_schema):
+    """
+    The function builds the SQL expression of a column whose values compare in the order of the column:
+    the column itself for numbers, dates and timestamps, and the month number (see `month_ordinal`) of
+    text month columns in `schema`. Other text columns would compare alphabetically, e.g. 'Dec-2022' <
+    'Sep-2022', so they raise a ValueError.
+
+    :return: The SQL expression and the kind of its values: 'number', 'date' or 'month'
+    """
+    column = table.c[name]
+    spec = schema.get(name, {})
+    if _is_numeric(column):
+        return column, 'number'
+    if isinstance(column.type, (Date, DateTime)):
+        return column, 'date'
+    if isinstance(column.type, String) and spec.get('dtype') == 'month':
+        expression = month_ordinal(column, spec.get('format', '%b-%Y'))
+        if expression is not None:
+            return expression, 'month'
+    raise ValueError(f"{name} is {column.type} and does not compare in order in SQL, use a number, date or month column")
+
+
+def pushdown_select(table, columns=None, schema=loan_payments_schema, parse_term=True):
+    """
+    The function builds the SELECT of the columns needed with the conversions of `schema` done by the
+    database where SQL can do them: rounding, integer casts, month strings to month numbers, booleans and
+    the term. Category columns are sent as they are.
+
+    :param table: A SQLAlchemy Table, see `reflect_table`
+    :param columns: The columns to select, by default all of them
+    :param schema: Dictionary of column name -> conversion, as `EDA.loan_payments_schema`
+    :param parse_term: If True the term is sent as a number of months
+    :return: The SELECT and a dictionary of column name -> conversion left for `finish_conversions`
+    """
+    columns = [column.name for column in table.columns] if columns is None else list(columns)
+    expressions, remaining = [], {}
+    for name in columns:
+        column = table.c[name]
+        spec = schema.get(name, {})
+        dtype = spec.get('dtype')
+        expression = column
+        if name == 'term' and parse_term:
+            expression = term_months(column)
+        elif 'parser' in spec:
+            remaining[name] = spec
+        else:
+            if 'round' in spec:
+                expression = func.round(expression, spec['round'])
+            if dtype == 'month' and month_ordinal(column, spec.get('format', '%b-%Y')) is not None:
+                expression = month_ordinal(column, spec.get('format', '%b-%Y'))
+                remaining[name] = {'dtype': 'month_ordinal', 'output': spec.get('output', 'datetime')}
+            elif dtype == 'bool':
+                expression = type_coerce(case((column.in_(spec.get('true_values', [True])), True), else_=False), Boolean)
+                remaining[name] = {'dtype': 'bool'}
+            elif dtype == 'int64':
+                expression = cast(expression, BigInteger)
+                remaining[name] = {'dtype': 'int64'}
+            elif dtype is not None:
+                remaining[name] = {key: value for key, value in spec.items() if key != 'round'}
+        expressions.append(expression.label(name))
+    return select(*expressions), remaining
+
+
+def chunk_schema(engine, table, schema=loan_payments_schema, categories=None):
+    """
+    The function returns a schema giving every chunk of a table the same data types, whatever rows the
+    chunk holds. pandas infers the types of each chunk from its values, so an integer column is float in
+    the chunks with nulls, a column with only nulls is object, and a category column gets the categories
+    of the chunk. Here the types come from the database instead, and match those of reading the whole
+    table and applying `schema`:
+    - 'int64' entries become the nullable 'Int64', as any chunk of them may hold nulls
+    - other integer columns stay int64, or float64 if the table holds nulls in them
+    - 'category' entries get the categories of every distinct value in the table
+    - other numeric columns become float64, dates datetime and text the default text type of pandas
+    - the other entries of `schema` are kept as they are
+    The distinct values and null counts are read with one connection, one query for the null counts and
+    one for each category column not in `categories`.
+
+    :param categories: Dictionary of column name -> list of its values, for category columns whose values
+    are already known, so the table isn't read for them
+    :return: Dictionary of column name -> conversion, for `DataTransform.apply_schema`
+    """
+    source = reflect_table(engine, table)
+    text_dtype = pd.Series(['']).dtype
+    categories = dict(categories or {})
+    integers = [column for column in source.columns if schema.get(column.name, {}).get('dtype') is None
+                and isinstance(column.type, Integer) and column.nullable]
+    nulls = {}
+    with engine.connect() as connection:
+        for column in source.columns:
+            if schema.get(column.name, {}).get('dtype') == 'category' and column.name not in categories:
+                categories[column.name] = connection.execute(select(column).distinct().where(column.is_not(None))).scalars().all()
+        if integers:
+            row = connection.execute(select(*[(func.count() - func.count(column)).label(column.name) for column in integers])).one()
+            nulls = dict(row._mapping)
+    chunk = {}
+    for column in source.columns:
+        spec = dict(schema.get(column.name, {}))
+        dtype = spec.get('dtype')
+        if dtype == 'category':
+            spec['dtype'] = pd.CategoricalDtype(sorted(categories[column.name]))
+        elif dtype == 'int64':
+            spec['dtype'] = 'Int64'
+        elif dtype is None and isinstance(column.type, Integer):
+            spec['dtype'] = 'float64' if nulls.get(column.name) else 'int64'
+        elif dtype is None and _is_numeric(column):
+            spec['dtype'] = 'float64'
+        elif dtype is None and isinstance(column.type, (Date, DateTime)):
+            spec['dtype'] = 'datetime'
+        elif dtype is None and isinstance(column.type, String):
+            spec['dtype'] = text_dtype
+        chunk[column.name] = spec
+    return chunk
+
+
+def finish_conversions(df, remaining):
+    """
+    The function applies the conversions left by `pushdown_select` to the extracted dataframe in place:
+    categories, month numbers to `parse_months` output, and anything SQL could not do.
+
+    :return: The same DataFrame
+    """
+    for name, spec in remaining.items():
+        if spec['dtype'] == 'month_ordinal':
+            df[name] = months_from_ordinals(df[name], spec['output'])
+        elif spec['dtype'] == 'bool':
+            df[name] = df[name].astype(bool)
+        else:
+            df[name] = convert_column(df[name], spec)
+    return df
+
+
+def _is_numeric(column):
+    """
+    The function returns True for columns the database can average.
+    """
+    return isinstance(column.type, (Integer, Float, Numeric))
+
+
+def summary_select(table, columns=None, schema=loan_payments_schema):
+    """
+    The function builds one SELECT returning the row count and, for each column, the count of values,
+    the count of distinct values, the minimum and maximum, and for numeric columns the mean of the values
+    and the mean of their squared deviations from it, so the whole summary is one row. The means come from
+    a subquery, so the deviations are squared after the mean is taken off and the variance of columns with
+    a large mean and a small spread, e.g. `id`, is not lost to rounding. The minimum and maximum of month
+    columns in `schema` are taken over the month numbers, not the strings.
+    """
+    columns = [column.name for column in table.columns] if columns is None else list(columns)
+    numeric = [name for name in columns if _is_numeric(table.c[name])]
+    means = select(*[func.avg(cast(table.c[name], Float)).label(name) for name in numeric]).subquery('means') if numeric else None
+    expressions = [func.count().label('rows')]
+    for name in columns:
+        column = table.c[name]
+        spec = schema.get(name, {})
+        ordered = month_ordinal(column, spec.get('format', '%b-%Y')) if spec.get('dtype') == 'month' else None
+        ordered = column if ordered is None else ordered
+        expressions += [func.count(column).label(f"{name}.count"), func.count(distinct(column)).label(f"{name}.distinct"),
+                        func.min(ordered).label(f"{name}.min"), func.max(ordered).label(f"{name}.max")]
+        if name in numeric:
+            deviation = cast(column, Float) - means.c[name]
+            expressions += [func.max(means.c[name]).label(f"{name}.mean"),
+                            func.avg(deviation * deviation).label(f"{name}.mean_square_deviation")]
+    query = select(*expressions)
+    #the subquery is one row, joining it adds its means to every row of the table
+    return query.select_from(table.join(means, true())) if numeric else query.select_from(table)
+
+
+def summary_frame(row, columns, schema=loan_payments_schema):
+    """
+    The function turns the row of `summary_select` into a DataFrame with one row per column and the
+    statistics of `profiling.StreamingProfiler.summary`: count, nulls, null_percentage, distinct, mean,
+    std, min and max. The minimum and maximum of month columns are given as dates.
+    """
+    row = dict(row._mapping)
+    rows = row['rows']
+    summary = {}
+    for name in columns:
+        count = row[f"{name}.count"]
+        statistics = {'count': count, 'nulls': rows - count, 'null_percentage': (rows - count) * 100 / rows if rows else np.nan,
+                      'distinct': row[f"{name}.distinct"]}
+        if f"{name}.mean" in row and count:
+            mean, mean_square_deviation = row[f"{name}.mean"], row[f"{name}.mean_square_deviation"]
+            variance = mean_square_deviation * count / (count - 1) if count > 1 else np.nan
+            statistics.update({'mean': mean, 'std': np.sqrt(variance)})
+        low, high = row[f"{name}.min"], row[f"{name}.max"]
+        if schema.get(name, {}).get('dtype') == 'month' and isinstance(low, (int, np.integer)):
+            low, high = months_from_ordinals(pd.Series([low, high])).tolist()
+        statistics.update({'min': low, 'max': high})
+        summary[name] = statistics
+    return pd.DataFrame.from_dict(summary, orient='index')
+
+
+def value_counts_select(table, column):
+    """
+    The function builds the SELECT of the number of rows of each value of a column, nulls included.
+    """
+    column = table.c[column]
+    return select(column, func.count().label('count')).group_by(column).order_by(func.count().desc())
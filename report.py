@@ -0,0 +1,157 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import hashlib
+import html
+import inspect
+import json
+import os
+import sys
+import time
+
+from EDA_DataFrameInfo import plotter
+from pipeline import file_digest, local_sources
+from storage import file_fingerprint, stage_path
+
+
+#the figures of the EDA report, as drawn one by one in EDA_DataFrameInfo.py
+#name: file name of the figure, plot: plotter method, kwargs: its arguments
+DEFAULT_REPORT = [
+    {'name': 'missing_values', 'plot': 'msno_matrix', 'kwargs': {}},
+    {'name': 'scatter_total_payment_inv', 'plot': 'scatter_plot',
+     'kwargs': {'column_1': 'total_payment_inv', 'column_2': 'last_payment_amount'}},
+    {'name': 'density_total_payment_inv', 'plot': 'density_plot',
+     'kwargs': {'column_1': 'total_payment_inv', 'column_2': 'last_payment_amount'}},
+    {'name': 'histogram_total_payment', 'plot': 'histogram', 'kwargs': {'column_1': 'total_payment'}},
+    {'name': 'box_instalment_int_rate', 'plot': 'box_plot', 'kwargs': {'column_1': 'instalment', 'column_2': 'int_rate'}},
+    {'name': 'pair_plot', 'plot': 'pair_plot',
+     'kwargs': {'columns': ['loan_amount', 'int_rate', 'instalment', 'annual_inc', 'dti', 'total_payment']}},
+    {'name': 'correlation', 'plot': 'heat_map', 'kwargs': {}},
+]
+
+#file in the output directory recording the inputs of each figure drawn
+MANIFEST = 'manifest.json'
+
+_plotter = None
+
+
+def _initialise_worker(snapshot_path):
+    """
+    The function sets the Agg backend and creates the plotter of a worker process. The plotter loads the
+    snapshot the first time a figure needs the dataframe, and the snapshot is memory-mapped, so the
+    workers share one copy of the columns in the page cache.
+    """
+    global _plotter
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+    _plotter = plotter(path=snapshot_path)
+
+
+def figure_key(spec, snapshot_path, formats):
+    """
+    The function returns a SHA-256 of everything a figure depends on: the snapshot's path, size and
+    modification time, the spec, the file formats, the source code of the plotter method and of the
+    plotter methods it calls, and the code they use (see `pipeline.local_sources`), e.g. the aggregates
+    of plot_aggregates.py the figure is drawn from.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([file_fingerprint(snapshot_path), spec, list(formats)], sort_keys=True, default=str).encode())
+    method = getattr(plotter, spec['plot'])
+    #methods called on self, e.g. _show, are attributes rather than globals so they are added here
+    methods = [method] + [getattr(plotter, name) for name in sorted(set(method.__code__.co_names))
+                          if name != spec['plot'] and inspect.isfunction(getattr(plotter, name, None))]
+    sources = set()
+    for function in methods:
+        digest.update(inspect.getsource(function).encode())
+        helpers, paths = local_sources(function)
+        for helper in helpers:
+            digest.update(inspect.getsource(helper).encode())
+        sources.update(paths)
+    for path in sorted(sources):
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+
+def _render(spec, output_dir, formats):
+    """
+    The function draws one figure in a worker process and saves it in each format.
+
+    :return: The seconds taken
+    """
+    start = time.perf_counter()
+    _plotter.output = os.path.join(output_dir, spec['name'])
+    _plotter.formats = list(formats)
+    getattr(_plotter, spec['plot'])(**spec.get('kwargs', {}))
+    return time.perf_counter() - start
+
+
+def render_report(snapshot_path=stage_path('transformed_loan_payments', 'arrow'), specs=DEFAULT_REPORT,
+                  output_dir='report', formats=('png',), workers=None):
+    """
+    The function draws the figures of `specs` in a process pool with the Agg backend, so no display is
+    needed, and writes them with an HTML index to `output_dir`. A figure whose key (see `figure_key`) is
+    the same as in the last report and whose files exist is not drawn again.
+
+    :param snapshot_path: The Arrow snapshot the figures are drawn from
+    :param specs: List of dictionaries with the 'name', the 'plot' (plotter method) and its 'kwargs'
+    :param formats: The file formats, e.g. ('png', 'svg')
+    :param workers: The number of processes, by default the number of CPUs
+    :return: List of (name, 'drawn' or 'unchanged', seconds)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as r:
+            manifest = json.load(r)
+
+    keys = {spec['name']: figure_key(spec, snapshot_path, formats) for spec in specs}
+    changed = [spec for spec in specs if manifest.get(spec['name']) != keys[spec['name']]
+               or not all(os.path.exists(os.path.join(output_dir, f"{spec['name']}.{file_format}")) for file_format in formats)]
+    results = {spec['name']: 'unchanged' for spec in specs}
+    seconds = {spec['name']: 0.0 for spec in specs}
+
+    if changed:
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(changed)), initializer=_initialise_worker,
+                                 initargs=(snapshot_path,)) as executor:
+            for spec, taken in zip(changed, executor.map(_render, changed, repeat(output_dir), repeat(formats))):
+                results[spec['name']], seconds[spec['name']] = 'drawn', taken
+                manifest[spec['name']] = keys[spec['name']]
+                #the manifest is saved after each figure so an interrupted report keeps the figures drawn
+                _write_json(manifest_path, manifest)
+
+    write_index(os.path.join(output_dir, 'index.html'), specs, formats, snapshot_path)
+    return [(spec['name'], results[spec['name']], seconds[spec['name']]) for spec in specs]
+
+
+def _write_json(path, data):
+    """
+    The function replaces a JSON file in one step.
+    """
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'w') as w:
+        json.dump(data, w, indent=1, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def write_index(path, specs, formats, snapshot_path):
+    """
+    The function writes an HTML page showing every figure of the report, using the first format.
+    """
+    sections = []
+    for spec in specs:
+        links = ' '.join(f'<a href="{html.escape(spec["name"])}.{file_format}">{file_format}</a>' for file_format in formats)
+        arguments = ', '.join(f"{name}={value!r}" for name, value in spec.get('kwargs', {}).items())
+        sections.append(f'<h2>{html.escape(spec["name"])}</h2>\n'
+                        f'<p><code>plotter.{html.escape(spec["plot"])}({html.escape(arguments)})</code> {links}</p>\n'
+                        f'<img src="{html.escape(spec["name"])}.{formats[0]}" alt="{html.escape(spec["name"])}" style="max-width: 100%">')
+    with open(path, 'w') as w:
+        w.write('<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>Loan Payments EDA Report</title></head>\n<body>\n'
+                f'<h1>Loan Payments EDA Report</h1>\n<p>Drawn from {html.escape(os.path.abspath(snapshot_path))}</p>\n'
+                + '\n'.join(sections) + '\n</body>\n</html>\n')
+
+
+if __name__ == '__main__':
+    snapshot = sys.argv[1] if len(sys.argv) > 1 else stage_path('transformed_loan_payments', 'arrow')
+    output = sys.argv[2] if len(sys.argv) > 2 else 'report'
+    for name, status, taken in render_report(snapshot, output_dir=output, formats=('png', 'svg')):
+        print(f"{name}: {status} in {taken:.2f}s")
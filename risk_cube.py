@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+from portfolio import CHARGED_OFF
+from storage import iter_chunks, load_frame, save_frame
+
+
+#categorical columns the cube is keyed by
+DIMENSIONS = ['grade', 'sub_grade', 'purpose', 'home_ownership', 'employment_length', 'loan_status']
+
+#sums kept in every cell of the cube
+MEASURES = ['loans', 'loan_amount', 'total_payment', 'recoveries', 'charged_off_loans', 'charged_off_amount',
+            'charged_off_exposure']
+
+
+class RiskCube:
+    """
+    The RiskCube class keeps the loan counts and sums of the loss indicators for every combination of
+    grade, sub_grade, purpose, home_ownership, employment_length and loan_status seen. The cube is built
+    from batches of loans, a new batch is added (or an old version of loans removed) by grouping only the
+    batch and adding its cells, and queries are answered from the cells without reading the loans again.
+
+    The measures of a cell are the number of loans, the sums of loan_amount, total_payment and recoveries,
+    and for charged off loans their number, their loan_amount and their exposure (loan_amount less the
+    payments received, never below 0). `rollup` adds the ratios:
+    - charged_off_rate: charged off loans / loans
+    - loss_ratio: charged off exposure / loan_amount
+    - recovery_rate: recoveries / charged off loan_amount
+    - payment_ratio: total_payment / loan_amount
+
+    Paramaters:
+    dimensions: List of the categorical columns the cube is keyed by
+    charged_off: The loan_status values counted as charged off
+
+    Atributes:
+    self.cells: DataFrame with one row per combination of the dimensions and one column per measure
+
+    Methods:
+    update(): Adds a batch of loans
+    remove(): Removes a batch of loans added before, e.g. the old rows of updated loans
+    slice(): Returns the cells matching values of some dimensions
+    rollup(): Returns the measures and ratios summed to some of the dimensions
+    save(): Saves the cells to a Parquet file
+    load(): Loads a cube saved by `save`
+    """
+    def __init__(self, dimensions=DIMENSIONS, charged_off=CHARGED_OFF):
+        self.dimensions = list(dimensions)
+        self.charged_off = list(charged_off)
+        self.cells = pd.DataFrame({col: pd.Series(dtype=object) for col in self.dimensions} |
+                                  {col: pd.Series(dtype='float64') for col in MEASURES})
+
+    def _batch_cells(self, chunk):
+        """
+        The function groups a batch of loans into cells, the categorical dimensions are grouped by code.
+        """
+        loan_amount = chunk['loan_amount'].to_numpy(dtype='float64', na_value=np.nan)
+        total_payment = chunk['total_payment'].to_numpy(dtype='float64', na_value=np.nan)
+        charged_off = chunk['loan_status'].isin(self.charged_off).to_numpy()
+        measures = pd.DataFrame({
+            'loans': 1.0,
+            'loan_amount': loan_amount,
+            'total_payment': total_payment,
+            'recoveries': chunk['recoveries'].to_numpy(dtype='float64', na_value=np.nan),
+            'charged_off_loans': charged_off.astype('float64'),
+            'charged_off_amount': np.where(charged_off, loan_amount, 0.0),
+            'charged_off_exposure': np.where(charged_off, np.clip(loan_amount - np.nan_to_num(total_payment), 0, None), 0.0),
+        }, index=chunk.index)
+        cells = measures.groupby([chunk[col] for col in self.dimensions], observed=True, dropna=False).sum()
+        #the few cell keys are stored as plain values so batches with different categories can be added
+        return cells.reset_index().astype({col: object for col in self.dimensions})
+
+    def _add(self, cells):
+        """
+        The function adds cells to the cube, summing the measures of cells with the same key.
+        """
+        combined = pd.concat([self.cells, cells], ignore_index=True) if len(self.cells) else cells
+        combined = combined.groupby(self.dimensions, dropna=False, sort=True)[MEASURES].sum().reset_index()
+        self.cells = combined[combined['loans'] != 0].reset_index(drop=True)
+
+    def update(self, chunk):
+        """
+        The function adds a batch of loans to the cube. Only the batch is grouped, the work to add it to
+        the cube depends on the number of cells and not on the number of loans already added.
+
+        :return: The same RiskCube
+        """
+        self._add(self._batch_cells(chunk))
+        return self
+
+    def remove(self, chunk):
+        """
+        The function removes a batch of loans that was added before, so a loan whose status or payments
+        changed can be replaced by removing its old row and adding the new one.
+
+        :return: The same RiskCube
+        """
+        cells = self._batch_cells(chunk)
+        cells[MEASURES] = -cells[MEASURES]
+        self._add(cells)
+        return self
+
+    def slice(self, **values):
+        """
+        The function returns the cells matching the given dimension values, e.g. `slice(grade='A')` or
+        `slice(purpose=['car', 'house'], loan_status='Charged Off')`.
+        """
+        keep = np.ones(len(self.cells), dtype=bool)
+        for col, value in values.items():
+            if col not in self.dimensions:
+                raise KeyError(f"{col} is not a dimension of the cube")
+            keep &= self.cells[col].isin(value if isinstance(value, (list, tuple, set)) else [value]).to_numpy()
+        return self.cells[keep]
+
+    def rollup(self, by=(), **values):
+        """
+        The function sums the measures of the cells matching `values` (see `slice`) to the dimensions in
+        `by`, and adds the ratios. With no dimensions it returns the total of the matching cells.
+
+        :param by: A dimension or list of dimensions to keep, e.g. 'grade' or ['grade', 'loan_status']
+        :return: A DataFrame with one row per value of `by`
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        cells = self.slice(**values)
+        if by:
+            totals = cells.groupby(by, dropna=False, sort=True)[MEASURES].sum()
+        else:
+            totals = cells[MEASURES].sum().to_frame('total').T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            totals['charged_off_rate'] = totals['charged_off_loans'] / totals['loans']
+            totals['loss_ratio'] = totals['charged_off_exposure'] / totals['loan_amount']
+            totals['recovery_rate'] = totals['recoveries'] / totals['charged_off_amount']
+            totals['payment_ratio'] = totals['total_payment'] / totals['loan_amount']
+        totals['loans'] = totals['loans'].astype('int64')
+        totals['charged_off_loans'] = totals['charged_off_loans'].astype('int64')
+        return totals
+
+    def save(self, path):
+        """
+        The function saves the cells to a Parquet file.
+        """
+        cells = self.cells.astype({col: 'string' for col in self.dimensions})
+        save_frame(cells, path)
+
+    @classmethod
+    def load(cls, path, charged_off=CHARGED_OFF):
+        """
+        The function creates a RiskCube from a file written by `save`.
+        """
+        cells = load_frame(path)
+        dimensions = [col for col in cells.columns if col not in MEASURES]
+        cube = cls(dimensions, charged_off)
+        cube.cells = cells.astype({col: object for col in dimensions})
+        for col in dimensions:
+            cube.cells[col] = cube.cells[col].where(cube.cells[col].notna(), np.nan)
+        return cube
+
+
+def build_cube(path, chunksize=100000, dimensions=DIMENSIONS):
+    """
+    The function builds the cube of a Parquet, Arrow or CSV file one chunk at a time. The monetary columns
+    are summed, so the file must hold them as amounts, e.g. cleaned_loan_payments.arrow and not the table
+    after the skew and outlier steps.
+
+    :return: The RiskCube
+    """
+    columns = list(dict.fromkeys(list(dimensions) + ['loan_status', 'loan_amount', 'total_payment', 'recoveries']))
+    cube = RiskCube(dimensions)
+    for chunk in iter_chunks(path, chunksize, columns):
+        cube.update(chunk)
+    return cube
+
+
+if __name__ == '__main__':
+    from storage import stage_path
+    cube = build_cube(stage_path('cleaned_loan_payments', 'arrow'))
+    cube.save(stage_path('risk_cube'))
+    for indicator in ['grade', 'purpose', 'home_ownership']:
+        print(cube.rollup(indicator).to_string())
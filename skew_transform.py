@@ -0,0 +1,161 @@
+import os
+
+import numpy as np
+import pandas as pd
+import yaml
+
+
+#transforms supported by SkewTransformer
+METHODS = ('log', 'log1p', 'boxcox', 'yeojohnson')
+
+
+def skewness(df, columns):
+    """
+    The function computes the skewness of several numeric columns at once from one float block, the
+    same adjusted Fisher-Pearson value as `DataFrame.skew()`. Nulls are ignored.
+
+    :param df: The pandas DataFrame
+    :param columns: The numeric columns to measure
+    :return: A pandas Series of column name -> skewness
+    """
+    block = df[columns].to_numpy(dtype='float64', na_value=np.nan)
+    present = ~np.isnan(block)
+    n = present.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(block, axis=0) / n
+        deviations = np.where(present, block - mean, 0.0)
+        m2 = (deviations ** 2).sum(axis=0) / n
+        m3 = (deviations ** 3).sum(axis=0) / n
+        skew = np.sqrt(n * (n - 1)) / (n - 2) * m3 / m2 ** 1.5
+    skew = np.where((n < 3) | (m2 == 0), np.where(n < 3, np.nan, 0.0), skew)
+    return pd.Series(skew, index=columns)
+
+
+class SkewTransformer:
+    """
+    The SkewTransformer class reduces the skew of numeric columns with a log, log1p, Box-Cox or
+    Yeo-Johnson transform applied to the whole column block with NumPy ufuncs. The fitted parameters
+    (Box-Cox/Yeo-Johnson lambdas and shifts) are kept and can be saved, so the same transform can be
+    replayed on new data without fitting again.
+
+    Paramaters:
+    method: 'log' (log of positive values, 0 otherwise, as `DataFrameTransform.log_transformation` did),
+    'log1p', 'boxcox' or 'yeojohnson'
+    sample_size: The largest number of rows used to fit the Box-Cox and Yeo-Johnson lambdas
+
+    Atributes:
+    self.params: Dictionary of column name -> {'lambda': ..., 'shift': ...}
+
+    Methods:
+    __init__(): Initialises the class
+    find_skewed(): Returns the columns whose skewness is beyond a threshold
+    fit(): Finds the parameters of the transform for each column
+    transform(): Applies the fitted transform to a dataframe in place
+    save(): Saves the method and parameters to a YAML file
+    load(): Loads a transformer saved by `save`
+    """
+    def __init__(self, method='log', sample_size=100000):
+        """
+        The function initialises the class with the transform to use.
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown method {method}, expected one of {METHODS}")
+        self.method = method
+        self.sample_size = sample_size
+        self.params = {}
+
+    @staticmethod
+    def find_skewed(df, columns, threshold=1):
+        """
+        The function returns the names of the columns with a skewness greater than `threshold` or less
+        than -`threshold`.
+        """
+        skew = skewness(df, columns)
+        return skew[skew.abs() > threshold].index.tolist()
+
+    def fit(self, df, columns):
+        """
+        The function finds the parameters of the transform for each column. Box-Cox needs positive values,
+        so columns with values of 0 or less are shifted by 1 - their minimum first.
+
+        :return: The fitted SkewTransformer
+        """
+        self.params = {}
+        for col in columns:
+            values = df[col].to_numpy(dtype='float64', na_value=np.nan)
+            values = values[~np.isnan(values)]
+            if len(values) > self.sample_size:
+                values = np.random.default_rng(0).choice(values, self.sample_size, replace=False)
+            params = {'lambda': None, 'shift': 0.0}
+            if self.method == 'boxcox' and len(values):
+                from scipy import stats
+                params['shift'] = float(1 - values.min()) if values.min() <= 0 else 0.0
+                params['lambda'] = float(stats.boxcox_normmax(values + params['shift'], method='mle'))
+            elif self.method == 'yeojohnson' and len(values):
+                from scipy import stats
+                params['lambda'] = float(stats.yeojohnson_normmax(values))
+            self.params[col] = params
+        return self
+
+    def transform(self, df):
+        """
+        The function applies the fitted transform to the fitted columns of `df` in place. The columns are
+        converted to one float block, transformed with ufuncs and written back; nulls stay null.
+
+        :return: The same DataFrame
+        """
+        columns = [col for col in self.params if col in df.columns]
+        if not columns:
+            return df
+        block = df[columns].to_numpy(dtype='float64', na_value=np.nan)
+        lambdas = np.array([np.nan if self.params[col]['lambda'] is None else self.params[col]['lambda'] for col in columns])
+        shifts = np.array([self.params[col]['shift'] for col in columns])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.method == 'log':
+                positive = block > 0
+                np.log(block, out=block, where=positive)
+                block[~positive & ~np.isnan(block)] = 0.0
+            elif self.method == 'log1p':
+                np.log1p(block, out=block)
+            elif self.method == 'boxcox':
+                block += shifts
+                block = np.where(np.abs(lambdas) < 1e-8, np.log(block), (block ** lambdas - 1) / lambdas)
+            else:
+                block = _yeojohnson(block, lambdas)
+
+        df[columns] = block
+        return df
+
+    def save(self, path):
+        """
+        The function saves the method and fitted parameters to a YAML file.
+        """
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w') as w:
+            yaml.safe_dump({'method': self.method, 'params': self.params}, w)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        The function creates a fitted SkewTransformer from a file written by `save`.
+        """
+        with open(path, 'r') as r:
+            saved = yaml.safe_load(r)
+        transformer = cls(saved['method'])
+        transformer.params = saved['params']
+        return transformer
+
+
+def _yeojohnson(block, lambdas):
+    """
+    The function applies the Yeo-Johnson transform with one lambda per column to a 2-D float block.
+    """
+    positive = block >= 0
+    lambda_zero = np.abs(lambdas) < 1e-8
+    lambda_two = np.abs(lambdas - 2) < 1e-8
+    positive_part = np.where(lambda_zero, np.log1p(np.abs(block)), ((np.abs(block) + 1) ** lambdas - 1) / np.where(lambda_zero, 1, lambdas))
+    negative_part = np.where(lambda_two, -np.log1p(np.abs(block)),
+                             -((np.abs(block) + 1) ** (2 - lambdas) - 1) / np.where(lambda_two, 1, 2 - lambdas))
+    return np.where(positive, positive_part, negative_part)
@@ -0,0 +1,173 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+
+#default file format passed between the pipeline stages
+DEFAULT_FORMAT = 'parquet'
+
+
+def stage_path(name, file_format=DEFAULT_FORMAT):
+    """
+    The function builds the file name of a stage output, e.g. 'loan_payments' -> 'loan_payments.parquet'.
+
+    :param name: The name of the stage output without a suffix
+    :param file_format: 'parquet', 'feather', 'arrow' or 'csv'
+    :return: The file name
+    """
+    return f"{name}.{file_format}"
+
+
+def _file_format(path):
+    """
+    The function returns the storage format of a file from its suffix.
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix in ('.parquet', '.pq'):
+        return 'parquet'
+    if suffix in ('.feather', '.arrow', '.ipc'):
+        return 'feather'
+    if suffix == '.csv':
+        return 'csv'
+    raise ValueError(f"Unknown file format for {path}, expected .parquet, .feather/.arrow or .csv")
+
+
+def save_frame(df, path, compression='zstd', row_group_size=100000):
+    """
+    The function saves a DataFrame in a columnar format chosen by the file suffix. Parquet and Arrow
+    IPC (Feather) keep the category, datetime, bool and integer data types set by `DataTransform`, so
+    the next stage does not have to parse text and cast the columns again.
+
+    :param df: The pandas DataFrame to save, the index is not saved
+    :param path: The file to write, ending in .parquet, .feather/.arrow or .csv
+    :param compression: The compression codec for Parquet/Feather, e.g. 'zstd', 'lz4', 'snappy' or None
+    :param row_group_size: The number of rows per Parquet row group, so readers can skip row groups
+    """
+    file_format = _file_format(path)
+    if file_format == 'parquet':
+        df.to_parquet(path, engine='pyarrow', index=False, compression=compression, row_group_size=row_group_size)
+    elif file_format == 'feather':
+        #feather only supports lz4 and zstd
+        feather.write_feather(df.reset_index(drop=True), path,
+                              compression=compression if compression in ('lz4', 'zstd') else 'uncompressed')
+    else:
+        df.to_csv(path, index=False)
+
+
+def load_frame(path, columns=None):
+    """
+    The function loads a DataFrame saved by `save_frame`, reading only the requested columns from
+    columnar files.
+
+    :param path: The file to read, ending in .parquet, .feather/.arrow or .csv
+    :param columns: A list of column names to read, or None for all columns
+    :return: The pandas DataFrame
+    """
+    file_format = _file_format(path)
+    if file_format == 'parquet':
+        return pd.read_parquet(path, engine='pyarrow', columns=columns)
+    if file_format == 'feather':
+        return feather.read_feather(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def save_chunks(chunks, path, compression='zstd'):
+    """
+    The function writes an iterable of DataFrame chunks to one Parquet file, one row group per chunk,
+    holding only one chunk in memory at a time. Every chunk is cast to the schema of the first chunk.
+
+    :param chunks: An iterable of pandas DataFrames with the same columns
+    :param path: The Parquet file to write
+    :param compression: The Parquet compression codec
+    :return: The total number of rows written
+    """
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression=compression)
+            else:
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def save_snapshot(df, path):
+    """
+    The function saves a DataFrame as an uncompressed Arrow IPC file that `open_snapshot` can memory-map.
+    Compression is turned off because compressed buffers have to be decompressed into private memory.
+
+    :param df: The pandas DataFrame to save, the index is not saved
+    :param path: The file to write, e.g. 'transformed_loan_payments.arrow'
+    """
+    feather.write_feather(df.reset_index(drop=True), path, compression='uncompressed')
+
+
+def open_snapshot(path, columns=None):
+    """
+    The function memory-maps a snapshot written by `save_snapshot` and returns it as an Arrow table
+    without reading or deserialising the columns. Opening takes about the same time for any file size,
+    and processes that open the same snapshot share one copy of the columns in the page cache.
+
+    :param path: The snapshot file
+    :param columns: A list of column names to keep, or None for all columns
+    :return: A pyarrow Table whose buffers point into the mapped file
+    """
+    source = pa.memory_map(path, 'r')
+    table = ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def load_snapshot(path, columns=None):
+    """
+    The function loads a snapshot written by `save_snapshot` as a pandas DataFrame. Numeric columns
+    without nulls are wrapped around the mapped memory rather than copied, other columns are converted
+    column by column, so selecting only the needed `columns` keeps the resident memory low.
+
+    :param path: The snapshot file
+    :param columns: A list of column names to load, or None for all columns
+    :return: The pandas DataFrame
+    """
+    return open_snapshot(path, columns).to_pandas(split_blocks=True)
+
+
+def iter_chunks(path, chunksize=100000, columns=None):
+    """
+    The function reads a file saved by `save_frame`, `save_chunks` or `save_snapshot` as a stream of
+    DataFrame chunks, so a table that does not fit in memory can be processed one chunk at a time.
+
+    :param path: The file to read, ending in .parquet, .feather/.arrow or .csv
+    :param chunksize: The largest number of rows in a chunk
+    :param columns: A list of column names to read, or None for all columns
+    :return: A generator of pandas DataFrames
+    """
+    file_format = _file_format(path)
+    if file_format == 'parquet':
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif file_format == 'feather':
+        for batch in open_snapshot(path, columns).to_batches(max_chunksize=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+def file_fingerprint(path):
+    """
+    The function returns the size and modification time of a file, to use in a cache key (e.g. as a
+    pipeline node parameter) so cached results are recomputed when the file changes.
+    """
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}